@@ -0,0 +1,113 @@
+import argparse
+import random
+
+import degrees
+from graph import Graph
+from util import QueueFrontier, DequeQueueFrontier
+
+# Search strategies, run on the dictionaries or on the compact graph
+STRATEGIES = ["bfs-list", "bfs-deque", "bidirectional", "compact"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark degrees searches on random pairs of people.")
+    parser.add_argument("directories", nargs="*", default=["small", "large"])
+    parser.add_argument("--queries", type=int, default=100,
+                        help="number of random pairs per dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES,
+                        default=STRATEGIES)
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        print(f"Loading {directory}...")
+        load_dicts(directory)
+        graph = Graph.from_directory(directory)
+
+        pairs = random_pairs(
+            sorted(degrees.people), args.queries, args.seed)
+        print(f"{directory}: {len(pairs)} queries")
+        print(f"  {'strategy':<14}{'p50 ms':>10}{'p90 ms':>10}"
+              f"{'p99 ms':>10}{'max ms':>10}{'expanded':>12}"
+              f"{'frontier':>10}{'sets':>10}")
+        for strategy in args.strategies:
+            results = run_strategy(strategy, pairs, graph)
+            print_results(strategy, results)
+
+
+def load_dicts(directory):
+    """
+    Load `directory` into the dictionaries of `degrees`,
+    discarding any previously loaded dataset.
+    """
+    degrees.names.clear()
+    degrees.people.clear()
+    degrees.movies.clear()
+    degrees.load_data(directory)
+
+
+def random_pairs(person_ids, n, seed):
+    """
+    Returns `n` (source, target) pairs drawn from `person_ids`
+    with a random number generator seeded with `seed`.
+    """
+    generator = random.Random(seed)
+    return [
+        (generator.choice(person_ids), generator.choice(person_ids))
+        for _ in range(n)
+    ]
+
+
+def run_strategy(strategy, pairs, graph):
+    """
+    Runs every pair through `strategy`.
+    Returns the `SearchStats` of each query.
+    """
+    results = []
+    for source, target in pairs:
+        if strategy == "bfs-list":
+            _, stats = degrees.timed_search(
+                degrees.shortest_path, source, target,
+                frontier_class=QueueFrontier)
+        elif strategy == "bfs-deque":
+            _, stats = degrees.timed_search(
+                degrees.shortest_path, source, target,
+                frontier_class=DequeQueueFrontier)
+        elif strategy == "bidirectional":
+            _, stats = degrees.timed_search(
+                degrees.bidirectional_search, source, target)
+        else:
+            _, stats = degrees.timed_search(
+                graph.shortest_path, graph.person_index(source),
+                graph.person_index(target))
+        results.append(stats)
+    return results
+
+
+def print_results(strategy, results):
+    """
+    Print latency percentiles and mean work done for one strategy.
+    """
+    latencies = sorted(stats.elapsed * 1000 for stats in results)
+    expanded = sum(stats.expanded for stats in results) / len(results)
+    frontier = max(stats.frontier_peak for stats in results)
+    sets = sum(stats.neighbor_sets for stats in results) / len(results)
+    print(f"  {strategy:<14}"
+          f"{percentile(latencies, 50):>10.3f}"
+          f"{percentile(latencies, 90):>10.3f}"
+          f"{percentile(latencies, 99):>10.3f}"
+          f"{latencies[-1]:>10.3f}"
+          f"{expanded:>12.1f}{frontier:>10}{sets:>10.1f}")
+
+
+def percentile(values, q):
+    """
+    Returns the `q`th percentile of sorted `values`, by nearest rank.
+    """
+    rank = max(1, -(-q * len(values) // 100))
+    return values[rank - 1]
+
+
+if __name__ == "__main__":
+    main()
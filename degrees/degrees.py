@@ -1,7 +1,16 @@
+import argparse
 import csv
+import json
+import queue
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from util import Node, StackFrontier, QueueFrontier
+from graph import Graph, TreeCache
+from util import (Node, StackFrontier, QueueFrontier, DequeQueueFrontier,
+                  NameIndex, SearchStats)
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,11 +21,41 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Compact integer-indexed graph, used instead of the dictionaries above
+# when data is loaded with `compact=True`
+graph = None
 
-def load_data(directory):
+# Cache of BFS trees from frequently queried people in `graph`
+trees = None
+
+# Prefix and fuzzy index over the loaded names, built on first use
+name_index = None
+
+# Non-interactive ways of choosing between people with the same name
+POLICIES = ["most-connected", "earliest-birth"]
+
+# Batch queries in flight per worker process
+QUERIES_PER_WORKER = 2
+
+
+def load_data(directory, compact=False, snapshot=False):
     """
     Load data from CSV files into memory.
+
+    If `compact` is true, load into a `Graph` instead of
+    the `names`, `people` and `movies` dictionaries.
+    If `snapshot` is true, the graph is loaded from (or saved to) a binary
+    snapshot of the CSV files, which implies `compact`.
     """
+    global graph, trees, name_index
+    name_index = None
+    if compact or snapshot:
+        graph = Graph.from_directory(directory, snapshot=snapshot)
+        trees = TreeCache(graph)
+        return
+    graph = None
+    trees = None
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -53,24 +92,61 @@ def load_data(directory):
 
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(
-        sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(
+        description="Find degrees of separation between two people.")
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--dicts", action="store_true",
+                        help="load the original dictionaries "
+                             "instead of the snapshot-cached graph")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer tab-separated name pairs from FILE "
+                             "('-' for stdin) as JSON lines")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes answering batch queries")
+    parser.add_argument("--policy", choices=POLICIES,
+                        help="resolve ambiguous or misspelled names "
+                             "without asking")
+    parser.add_argument("--stats", action="store_true",
+                        help="report the connected components of the graph")
+    parser.add_argument("--instrument", action="store_true",
+                        help="include search statistics in batch answers")
+    parser.add_argument("--tree-cache", metavar="MB", type=int,
+                        help="memory budget for cached BFS trees "
+                             "of frequently queried people")
+    args = parser.parse_args()
 
-    # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    # Load data from files into memory, using the snapshot cache
+    # unless the original dictionaries were asked for
+    log = sys.stderr if args.batch else sys.stdout
+    print("Loading data...", file=log)
+    load_data(args.directory, snapshot=not args.dicts)
+    if trees is not None and args.tree_cache is not None:
+        trees.max_bytes = args.tree_cache * 2 ** 20
+    print("Data loaded.", file=log)
+    if args.stats and graph is not None:
+        count, largest = graph.component_stats()
+        sizes = ", ".join(str(size) for size in largest)
+        print(f"{len(graph.person_ids)} people in {count} connected "
+              f"components (largest: {sizes}).", file=log)
 
-    source = person_id_for_name(input("Name: "))
+    if args.batch:
+        if args.batch == "-":
+            run_batch(sys.stdin, sys.stdout, args.directory, args.dicts,
+                      args.workers, args.policy, args.instrument)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                run_batch(f, sys.stdout, args.directory, args.dicts,
+                          args.workers, args.policy, args.instrument)
+        return
+
+    source = person_id_for_name(input("Name: "), args.policy)
     if source is None:
         sys.exit("Person not found.")
-    target = person_id_for_name(input("Name: "))
+    target = person_id_for_name(input("Name: "), args.policy)
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path = bidirectional_search(source, target)
 
     if path is None:
         print("Not connected.")
@@ -79,23 +155,29 @@ def main():
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = get_person(path[i][1])["name"]
+            person2 = get_person(path[i + 1][1])["name"]
+            movie = get_movie(path[i + 1][0])["title"]
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
-def shortest_path(source, target):
+def shortest_path(source, target, frontier_class=DequeQueueFrontier,
+                  stats=None):
     """
     Returns the shortest list of (movie_id, person_id) pairs
     that connect the source to the target.
 
     If no possible path, returns None.
+
+    The dictionaries are searched with a `frontier_class` frontier, and
+    if a `SearchStats` is given, the work done is counted in it.
     """
+    if graph is not None:
+        return compact_shortest_path(source, target, stats)
 
     # Initialize frontier with the starting node
     start = Node(state=source, parent=None, action=None)
-    frontier = QueueFrontier()
+    frontier = frontier_class()
     frontier.add(start)
 
     # Initialize an empty explored set
@@ -107,6 +189,9 @@ def shortest_path(source, target):
             return None
 
         # Choose a node from the frontier
+        if stats is not None:
+            stats.frontier_size(len(frontier.frontier))
+            stats.expanded += 1
         node = frontier.remove()
 
         # If node is the goal then we have a solution
@@ -123,6 +208,8 @@ def shortest_path(source, target):
 
         # Add neighbors to the frontier
         neighbors = neighbors_for_person(node.state)
+        if stats is not None:
+            stats.neighbor_sets += 1
         for neighbor in neighbors:
             if not frontier.contains_state(neighbor[1]) and not neighbor in explored:
                 child = Node(state=neighbor[1],
@@ -130,18 +217,111 @@ def shortest_path(source, target):
                 frontier.add(child)
 
 
-def person_id_for_name(name):
+def bidirectional_search(source, target, stats=None):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, growing a frontier from
+    both ends and expanding the smaller one each round until they meet.
+
+    If no possible path, returns None.
+    If a `SearchStats` is given, the work done is counted in it.
+    """
+    if graph is not None:
+        return compact_shortest_path(source, target, stats)
+
+    if source == target:
+        return []
+
+    # Maps each reached person to the (movie_id, person_id) pair
+    # that links them one step closer to the source / target
+    forward_parents = {source: None}
+    backward_parents = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+
+    while forward_frontier and backward_frontier:
+        if stats is not None:
+            stats.frontier_size(
+                len(forward_frontier) + len(backward_frontier))
+
+        # Expand whichever side has fewer people waiting
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meeting = expand_layer(
+                forward_frontier, forward_parents, backward_parents, stats)
+        else:
+            backward_frontier, meeting = expand_layer(
+                backward_frontier, backward_parents, forward_parents, stats)
+
+        # Once the frontiers touch, stitch the two halves together
+        if meeting is not None:
+            pairs = []
+            person_id = meeting
+            while forward_parents[person_id] is not None:
+                movie_id, parent_id = forward_parents[person_id]
+                pairs.append((movie_id, person_id))
+                person_id = parent_id
+            pairs.reverse()
+            person_id = meeting
+            while backward_parents[person_id] is not None:
+                movie_id, child_id = backward_parents[person_id]
+                pairs.append((movie_id, child_id))
+                person_id = child_id
+            return pairs
+
+    return None
+
+
+def expand_layer(frontier, parents, other_parents, stats=None):
+    """
+    Expands every person in `frontier` by one step, recording how each
+    newly reached person was reached in `parents`.
+
+    Returns the next frontier and a person already reached from the
+    other side (None if the two searches have not met yet).
+    """
+    next_frontier = []
+    meeting = None
+    if stats is not None:
+        stats.expanded += len(frontier)
+        stats.neighbor_sets += len(frontier)
+    for person_id in frontier:
+        for movie_id, neighbor_id in neighbors_for_person(person_id):
+            if neighbor_id in parents:
+                continue
+            parents[neighbor_id] = (movie_id, person_id)
+            next_frontier.append(neighbor_id)
+
+            # Every person in this layer is equally far from our end,
+            # so any meeting point found here yields a shortest path
+            if meeting is None and neighbor_id in other_parents:
+                meeting = neighbor_id
+    return next_frontier, meeting
+
+
+def person_id_for_name(name, policy=None):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    If `policy` is one of `POLICIES`, ambiguous and misspelled names
+    are resolved by `resolve_name` instead of asking.
     """
-    person_ids = list(names.get(name.lower(), set()))
+    if policy is not None:
+        return resolve_name(name, policy)
+
+    person_ids = person_ids_for_name(name)
     if len(person_ids) == 0:
+        suggestions = [
+            get_person(person_id)["name"]
+            for person_id in similar_person_ids(name)
+        ]
+        if suggestions:
+            print(f"Did you mean: {', '.join(suggestions)}?")
         return None
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
         for person_id in person_ids:
-            person = people[person_id]
+            person = get_person(person_id)
             name = person["name"]
             birth = person["birth"]
             print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
@@ -156,11 +336,94 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+def person_ids_for_name(name):
+    """
+    Returns a list of the IMDB ids of every person with a given name.
+    """
+    if graph is not None:
+        return [graph.person_ids[person]
+                for person in graph.people_named(name)]
+    return list(names.get(name.lower(), set()))
+
+
+def similar_person_ids(name, limit=10):
+    """
+    Returns the IMDB ids of up to `limit` people whose name is the
+    closest misspelling of `name`, or failing that, starts with `name`.
+    """
+    index = get_name_index()
+    matches = index.fuzzy(name, limit=limit)
+    if matches:
+        closest = [key for distance, key in matches
+                   if distance == matches[0][0]]
+    else:
+        closest = index.prefix(name, limit=limit)
+    person_ids = []
+    for key in closest:
+        person_ids.extend(person_ids_for_name(key))
+    return person_ids[:limit]
+
+
+def resolve_name(name, policy):
+    """
+    Returns the IMDB id for a person's name without asking, or None.
+
+    Falls back to misspelled and partial names when there is no exact
+    match, and picks between several people according to `policy`:
+    "most-connected" prefers the person with the most movies and
+    "earliest-birth" the person born first.
+    """
+    person_ids = person_ids_for_name(name) or similar_person_ids(name)
+    if not person_ids:
+        return None
+    if policy == "most-connected":
+        return max(person_ids, key=movie_count)
+    elif policy == "earliest-birth":
+        return min(person_ids, key=birth_order)
+    raise ValueError(f"unknown policy: {policy}")
+
+
+def movie_count(person_id):
+    """
+    Returns the number of movies a person starred in.
+    """
+    if graph is not None:
+        return len(graph.movies_for_person(graph.person_index(person_id)))
+    return len(people[person_id]["movies"])
+
+
+def birth_order(person_id):
+    """
+    Sort key placing people by birth year, unknown years last.
+    """
+    birth = get_person(person_id)["birth"]
+    return (0, int(birth)) if birth.isdigit() else (1, 0)
+
+
+def get_name_index():
+    """
+    Returns the `NameIndex` over the loaded names, building it if needed.
+    """
+    global name_index
+    if name_index is None:
+        if graph is not None:
+            name_index = graph.name_index()
+        else:
+            name_index = NameIndex.from_names(names)
+    return name_index
+
+
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
+    if graph is not None:
+        return set(
+            (graph.movie_ids[movie], graph.person_ids[person])
+            for movie, person in graph.neighbors(graph.person_index(person_id))
+        )
+
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
@@ -169,5 +432,189 @@ def neighbors_for_person(person_id):
     return neighbors
 
 
+def compact_shortest_path(source, target, stats=None):
+    """
+    Runs `shortest_path` on the compact graph, translating
+    between IMDB ids and graph indices.
+    """
+    path = trees.shortest_path(
+        graph.person_index(source), graph.person_index(target), stats)
+    if path is None:
+        return None
+    return [(graph.movie_ids[movie], graph.person_ids[person])
+            for movie, person in path]
+
+
+def timed_search(search, source, target, **kwargs):
+    """
+    Runs `search` from source to target with a fresh `SearchStats`.
+    Returns the path found and the stats, including the elapsed seconds.
+    """
+    stats = SearchStats()
+    start = time.perf_counter()
+    path = search(source, target, stats=stats, **kwargs)
+    stats.elapsed = time.perf_counter() - start
+    return path, stats
+
+
+def get_person(person_id):
+    """
+    Returns a dictionary of name and birth for a person,
+    from whichever representation is loaded.
+    """
+    if graph is not None:
+        person = graph.person_index(person_id)
+        return {
+            "name": graph.person_names[person],
+            "birth": graph.person_births[person]
+        }
+    return people[person_id]
+
+
+def get_movie(movie_id):
+    """
+    Returns a dictionary of title and year for a movie,
+    from whichever representation is loaded.
+    """
+    if graph is not None:
+        movie = graph.movie_index(movie_id)
+        return {
+            "title": graph.movie_titles[movie],
+            "year": graph.movie_years[movie]
+        }
+    return movies[movie_id]
+
+
+def run_batch(queries, output, directory, dicts=False, workers=1,
+              policy=None, instrument=False):
+    """
+    Answer every query line in `queries` and write one JSON object
+    per line to `output`, in the same order as the queries.
+    `policy` and `instrument` are passed on to `answer_query`.
+
+    With more than one worker, queries are answered by a process pool.
+    Workers inherit the loaded data when processes are forked,
+    and load it from `directory` themselves otherwise. Only
+    `QUERIES_PER_WORKER` queries per worker are read ahead, and answers
+    are written by a separate thread as soon as they are ready, so
+    `queries` may be a stream that stays open. If writing fails, the
+    remaining queries are cancelled and the error is raised.
+    """
+    lines = (line.rstrip("\r\n") for line in queries if line.strip())
+    answer = partial(answer_query, policy=policy, instrument=instrument)
+    if workers > 1:
+        window = QUERIES_PER_WORKER * workers
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(directory, dicts)) as executor:
+            pending = queue.Queue(maxsize=window)
+            failures = []
+            writer = threading.Thread(target=write_answers,
+                                      args=(pending, output, failures))
+            writer.start()
+            try:
+                for line in lines:
+                    if failures:
+                        break
+                    pending.put((line, executor.submit(answer, line)))
+            finally:
+                pending.put(None)
+                writer.join()
+            if failures:
+                raise failures[0]
+    else:
+        for line in lines:
+            print(json.dumps(answer(line)), file=output, flush=True)
+
+
+def write_answers(pending, output, failures):
+    """
+    Write the answer of each (line, future) taken from the `pending`
+    queue as a line of JSON to `output`, until None is taken.
+    A query that failed is answered with its error.
+
+    If writing fails, the error is added to `failures`, and the rest of
+    the queue is drained and cancelled so the reader is never blocked.
+    """
+    while (item := pending.get()) is not None:
+        line, future = item
+        if failures:
+            future.cancel()
+            continue
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"query": line, "error": f"{type(e).__name__}: {e}"}
+        try:
+            print(json.dumps(result), file=output, flush=True)
+        except Exception as e:
+            failures.append(e)
+
+
+def init_worker(directory, dicts):
+    """
+    Load data in a batch worker process, unless it was inherited.
+    """
+    if graph is None and not people:
+        load_data(directory, snapshot=not dicts)
+
+
+def answer_query(line, policy=None, instrument=False):
+    """
+    Answer a query line of the form "source name<TAB>target name".
+
+    Names must match exactly one person, unless a `policy` is given for
+    `resolve_name` to pick a person for ambiguous or misspelled names.
+
+    Returns a dictionary with the query, the people it was resolved to,
+    the number of degrees (None if not connected) and the path,
+    or an error message. If `instrument` is true, the search statistics
+    are included as well.
+    """
+    answer = {"query": line}
+    query = line.split("\t")
+    if len(query) != 2:
+        answer["error"] = "Expected two tab-separated names."
+        return answer
+
+    person_ids = []
+    for name in query:
+        if policy is not None:
+            person_id = resolve_name(name.strip(), policy)
+            matches = [] if person_id is None else [person_id]
+        else:
+            matches = person_ids_for_name(name.strip())
+        if len(matches) != 1:
+            answer["error"] = (f"Person not found: {name}" if not matches
+                               else f"Ambiguous name: {name}")
+            return answer
+        person_ids.append(matches[0])
+
+    source, target = person_ids
+    answer["source"] = {"person_id": source,
+                        "name": get_person(source)["name"]}
+    answer["target"] = {"person_id": target,
+                        "name": get_person(target)["name"]}
+    path, stats = timed_search(bidirectional_search, source, target)
+    if instrument:
+        answer["stats"] = stats.as_dict()
+    if path is None:
+        answer["degrees"] = None
+        answer["path"] = None
+        return answer
+
+    answer["degrees"] = len(path)
+    answer["path"] = [
+        {
+            "movie_id": movie_id,
+            "title": get_movie(movie_id)["title"],
+            "person_id": person_id,
+            "name": get_person(person_id)["name"]
+        }
+        for movie_id, person_id in path
+    ]
+    return answer
+
+
 if __name__ == "__main__":
     main()
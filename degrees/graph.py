@@ -0,0 +1,709 @@
+import csv
+import json
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+
+from util import NameIndex
+
+# Snapshots are written next to the CSV files they were built from,
+# and rebuilt whenever the version or any source file changes
+SNAPSHOT_NAME = "degrees.snapshot"
+SNAPSHOT_MAGIC = b"DEGREES\0"
+SNAPSHOT_VERSION = 3
+SOURCE_FILES = ["people.csv", "movies.csv", "stars.csv"]
+
+# Default memory budget for cached BFS trees, and how many times a source
+# must be queried before its tree is worth building
+TREE_CACHE_BYTES = 256 * 2 ** 20
+HOT_SOURCE_QUERIES = 100
+
+# Most (movie, person) pairs kept in the memoized co-star adjacency, and
+# most co-stars a person may have before they are expanded on the fly
+COSTAR_CACHE_PAIRS = 20_000_000
+COSTAR_HUB_SIZE = 5_000
+
+# Attributes stored as raw int64 arrays and as UTF-8 string tables,
+# so that a snapshot is memory-mapped without decoding anything up front
+ARRAYS = [
+    "person_offsets", "person_movies", "movie_offsets", "movie_stars",
+    "components", "component_sizes", "person_order", "movie_order",
+    "name_offsets", "name_people", "gram_offsets", "gram_positions"
+]
+STRINGS = [
+    "person_ids", "person_names", "person_births",
+    "movie_ids", "movie_titles", "movie_years",
+    "name_keys", "grams"
+]
+
+
+class Graph():
+    """
+    Compact actor/movie graph.
+
+    People and movies are interned into dense integer indices, and the
+    star relation is stored twice in compressed-sparse-row form: the movies
+    of person `p` are `person_movies[person_offsets[p]:person_offsets[p + 1]]`
+    and the stars of movie `m` are
+    `movie_stars[movie_offsets[m]:movie_offsets[m + 1]]`.
+    """
+
+    def __init__(self):
+        # Index -> IMDB id, name and birth year of each person
+        self.person_ids = []
+        self.person_names = []
+        self.person_births = []
+
+        # Index -> IMDB id, title and year of each movie
+        self.movie_ids = []
+        self.movie_titles = []
+        self.movie_years = []
+
+        # Indices sorted by IMDB id, to look ids up by binary search
+        self.person_order = array("q")
+        self.movie_order = array("q")
+
+        # Sorted distinct lowercase names; the people named `name_keys[k]`
+        # are `name_people[name_offsets[k]:name_offsets[k + 1]]`
+        self.name_keys = []
+        self.name_offsets = array("q", [0])
+        self.name_people = array("q")
+
+        # Trigram postings of `name_keys`, as used by `NameIndex`
+        self.grams = []
+        self.gram_offsets = array("q", [0])
+        self.gram_positions = array("q")
+
+        # Compressed-sparse-row adjacency in both directions
+        self.person_offsets = array("q", [0])
+        self.person_movies = array("q")
+        self.movie_offsets = array("q", [0])
+        self.movie_stars = array("q")
+
+        # Connected component label of each person, and size of each label
+        self.components = array("q")
+        self.component_sizes = array("q")
+
+        # Memoized co-star adjacency: person -> (movies, people) arrays
+        # with one representative movie per distinct co-star
+        self.costar_cache = {}
+        self.costar_pairs = 0
+        self.costar_limit = COSTAR_CACHE_PAIRS
+        self.hub_size = COSTAR_HUB_SIZE
+
+    @classmethod
+    def from_csv(cls, directory):
+        """
+        Build a graph from the people, movies and stars CSV files
+        in `directory`.
+        """
+        graph = cls()
+        person_index = {}
+        movie_index = {}
+        names = {}
+
+        # Load people
+        with open(f"{directory}/people.csv", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                person = len(graph.person_ids)
+                person_index[row["id"]] = person
+                graph.person_ids.append(row["id"])
+                graph.person_names.append(row["name"])
+                graph.person_births.append(row["birth"])
+                names.setdefault(row["name"].lower(), []).append(person)
+
+        # Load movies
+        with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                movie_index[row["id"]] = len(graph.movie_ids)
+                graph.movie_ids.append(row["id"])
+                graph.movie_titles.append(row["title"])
+                graph.movie_years.append(row["year"])
+
+        # Sort indices by id, and group people by name
+        graph.person_order = array("q", sorted(
+            range(len(graph.person_ids)), key=graph.person_ids.__getitem__))
+        graph.movie_order = array("q", sorted(
+            range(len(graph.movie_ids)), key=graph.movie_ids.__getitem__))
+        index = NameIndex.from_names(names)
+        graph.name_keys = index.keys
+        graph.grams = index.grams
+        graph.gram_offsets = index.offsets
+        graph.gram_positions = index.positions
+        for key in graph.name_keys:
+            graph.name_people.extend(names[key])
+            graph.name_offsets.append(len(graph.name_people))
+
+        # Load stars as parallel edge arrays, skipping unknown ids
+        edge_people = array("q")
+        edge_movies = array("q")
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                person = person_index.get(row["person_id"])
+                movie = movie_index.get(row["movie_id"])
+                if person is None or movie is None:
+                    continue
+                edge_people.append(person)
+                edge_movies.append(movie)
+
+        graph.person_offsets, graph.person_movies = to_csr(
+            edge_people, edge_movies, len(graph.person_ids))
+        graph.movie_offsets, graph.movie_stars = to_csr(
+            edge_movies, edge_people, len(graph.movie_ids))
+        graph.label_components()
+        return graph
+
+    @classmethod
+    def from_directory(cls, directory, snapshot=True):
+        """
+        Build a graph from the CSV files in `directory`.
+
+        If `snapshot` is true, load the graph from the binary snapshot in
+        `directory` when it is up to date, and otherwise build it from
+        the CSV files and write a fresh snapshot for the next run.
+        If the snapshot cannot be written, the graph is still returned.
+        """
+        if not snapshot:
+            return cls.from_csv(directory)
+
+        path = os.path.join(directory, SNAPSHOT_NAME)
+        sources = source_stats(directory)
+        graph = cls.load(path, sources)
+        if graph is None:
+            graph = cls.from_csv(directory)
+            try:
+                graph.save(path, sources)
+            except OSError as e:
+                print(f"Could not write snapshot: {e}", file=sys.stderr)
+        return graph
+
+    @classmethod
+    def load(cls, path, sources):
+        """
+        Load a graph from the snapshot at `path`, memory-mapping its arrays
+        and strings. Returns None if there is no usable snapshot for
+        `sources`.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        # The header is stored at the end, followed by its length
+        try:
+            if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError("not a snapshot")
+            length = int.from_bytes(data[-8:], "little")
+            header = json.loads(data[-8 - length:-8])
+        except ValueError:
+            data.close()
+            return None
+        if (header.get("version") != SNAPSHOT_VERSION or
+                header.get("byteorder") != sys.byteorder or
+                header.get("sources") != sources):
+            data.close()
+            return None
+
+        graph = cls()
+        view = memoryview(data)
+        for name in ARRAYS:
+            start, end = header["arrays"][name]
+            setattr(graph, name, view[start:end].cast("q"))
+        for name in STRINGS:
+            start, middle, end = header["strings"][name]
+            setattr(graph, name, StringTable(
+                view[start:middle], view[middle:end].cast("q")))
+        return graph
+
+    def save(self, path, sources):
+        """
+        Write the graph to a snapshot at `path`, tagged with `sources`.
+        Nothing is left behind if writing fails.
+        """
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "byteorder": sys.byteorder,
+            "sources": sources,
+            "arrays": {},
+            "strings": {}
+        }
+
+        def write_aligned(f, data):
+            # Arrays start at multiples of 8 bytes, so they can be cast
+            f.write(bytes(-f.tell() % 8))
+            start = f.tell()
+            f.write(data)
+            return start
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                for name in ARRAYS:
+                    start = write_aligned(f, getattr(self, name))
+                    header["arrays"][name] = [start, f.tell()]
+                for name in STRINGS:
+                    table = getattr(self, name)
+                    if not isinstance(table, StringTable):
+                        table = StringTable.from_strings(table)
+                    start = f.tell()
+                    f.write(table.data)
+                    middle = write_aligned(f, table.offsets)
+                    header["strings"][name] = [start, middle, f.tell()]
+                encoded = json.dumps(header).encode()
+                f.write(encoded)
+                f.write(len(encoded).to_bytes(8, "little"))
+
+            # Replace atomically so concurrent readers never see half a file
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+    def label_components(self):
+        """
+        Label every person with their connected component, by taking the
+        union of the stars of each movie in a union-find structure.
+        """
+        parents = array("q", range(len(self.person_ids)))
+
+        def find(person):
+            while parents[person] != person:
+                parents[person] = parents[parents[person]]
+                person = parents[person]
+            return person
+
+        for movie in range(len(self.movie_ids)):
+            stars = self.stars_for_movie(movie)
+            if len(stars) < 2:
+                continue
+            root = find(stars[0])
+            for star in stars[1:]:
+                other = find(star)
+                if other != root:
+                    parents[other] = root
+
+        # Number the roots densely, in order of first appearance
+        labels = {}
+        self.components = array("q", bytes(8 * len(self.person_ids)))
+        self.component_sizes = array("q")
+        for person in range(len(self.person_ids)):
+            root = find(person)
+            if root not in labels:
+                labels[root] = len(labels)
+                self.component_sizes.append(0)
+            self.components[person] = labels[root]
+            self.component_sizes[labels[root]] += 1
+
+    def person_index(self, person_id):
+        """
+        Returns the index of the person with an IMDB id.
+        Raises KeyError if there is no such person.
+        """
+        return find_id(self.person_ids, self.person_order, person_id)
+
+    def movie_index(self, movie_id):
+        """
+        Returns the index of the movie with an IMDB id.
+        Raises KeyError if there is no such movie.
+        """
+        return find_id(self.movie_ids, self.movie_order, movie_id)
+
+    def people_named(self, name):
+        """
+        Returns the indices of the people with a name, ignoring case.
+        """
+        key = name.lower()
+        position = bisect_left(self.name_keys, key)
+        if position == len(self.name_keys) or self.name_keys[position] != key:
+            return []
+        return list(self.name_people[
+            self.name_offsets[position]:self.name_offsets[position + 1]])
+
+    def name_index(self):
+        """
+        Returns a `NameIndex` over the names of the people in the graph.
+        """
+        return NameIndex(self.name_keys, self.grams,
+                         self.gram_offsets, self.gram_positions)
+
+    def connected(self, source, target):
+        """
+        Returns whether any path connects the source to the target.
+        """
+        return self.components[source] == self.components[target]
+
+    def component_stats(self, top=5):
+        """
+        Returns the number of components and the sizes
+        of the `top` largest ones.
+        """
+        return len(self.component_sizes), sorted(
+            self.component_sizes, reverse=True)[:top]
+
+    def movies_for_person(self, person):
+        """
+        Returns the indices of the movies a person starred in.
+        """
+        return self.person_movies[
+            self.person_offsets[person]:self.person_offsets[person + 1]]
+
+    def stars_for_movie(self, movie):
+        """
+        Returns the indices of the people who starred in a movie.
+        """
+        return self.movie_stars[
+            self.movie_offsets[movie]:self.movie_offsets[movie + 1]]
+
+    def neighbors(self, person):
+        """
+        Yields (movie, person) index pairs for people
+        who starred with a given person.
+        """
+        for movie in self.movies_for_person(person):
+            for star in self.stars_for_movie(movie):
+                yield movie, star
+
+    def costars(self, person):
+        """
+        Returns (movie, person) index pairs for each distinct person who
+        starred with a given person, with one movie they share.
+
+        Lists are memoized until the cache holds `costar_limit` pairs.
+        Hubs with more than `hub_size` co-stars are never memoized.
+        """
+        cached = self.costar_cache.get(person)
+        if cached is not None:
+            return zip(*cached)
+
+        shared = {}
+        for movie, star in self.neighbors(person):
+            if star != person and star not in shared:
+                shared[star] = movie
+        if (len(shared) <= self.hub_size and
+                self.costar_pairs + len(shared) <= self.costar_limit):
+            self.costar_cache[person] = (
+                array("q", shared.values()), array("q", shared.keys()))
+            self.costar_pairs += len(shared)
+        return ((movie, star) for star, movie in shared.items())
+
+    def precompute_costars(self):
+        """
+        Memoize the co-stars of every person, as far as the cache allows.
+        """
+        for person in range(len(self.person_ids)):
+            if self.costar_pairs >= self.costar_limit:
+                break
+            self.costars(person)
+
+    def shortest_path(self, source, target, stats=None):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to the target, searching from both ends.
+
+        If no possible path, returns None.
+        If a `SearchStats` is given, the work done is counted in it.
+        """
+        if source == target:
+            return []
+        if not self.connected(source, target):
+            return None
+
+        forward_parents = {source: None}
+        backward_parents = {target: None}
+        forward_frontier = [source]
+        backward_frontier = [target]
+
+        while forward_frontier and backward_frontier:
+            if stats is not None:
+                stats.frontier_size(
+                    len(forward_frontier) + len(backward_frontier))
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meeting = self.expand_layer(
+                    forward_frontier, forward_parents, backward_parents,
+                    stats)
+            else:
+                backward_frontier, meeting = self.expand_layer(
+                    backward_frontier, backward_parents, forward_parents,
+                    stats)
+
+            if meeting is not None:
+                pairs = []
+                person = meeting
+                while forward_parents[person] is not None:
+                    movie, parent = forward_parents[person]
+                    pairs.append((movie, person))
+                    person = parent
+                pairs.reverse()
+                person = meeting
+                while backward_parents[person] is not None:
+                    movie, child = backward_parents[person]
+                    pairs.append((movie, child))
+                    person = child
+                return pairs
+
+        return None
+
+    def bfs_tree(self, source, stats=None):
+        """
+        Returns a `BFSTree` with the distance from `source` to every person
+        and how each person is reached, from one breadth-first sweep.
+        If a `SearchStats` is given, the work done is counted in it.
+        """
+        size = len(self.person_ids)
+        tree = BFSTree(source, size)
+        tree.distances[source] = 0
+        queue = deque([source])
+        while queue:
+            if stats is not None:
+                stats.frontier_size(len(queue))
+                stats.expanded += 1
+                if queue[0] not in self.costar_cache:
+                    stats.neighbor_sets += 1
+            person = queue.popleft()
+            distance = tree.distances[person] + 1
+            for movie, neighbor in self.costars(person):
+                if tree.distances[neighbor] != -1:
+                    continue
+                tree.distances[neighbor] = distance
+                tree.parent_people[neighbor] = person
+                tree.parent_movies[neighbor] = movie
+                queue.append(neighbor)
+        return tree
+
+    def expand_layer(self, frontier, parents, other_parents, stats=None):
+        """
+        Expands every person in `frontier` by one step, recording how each
+        newly reached person was reached in `parents`.
+
+        Returns the next frontier and a person already reached from the
+        other side (None if the two searches have not met yet).
+        """
+        next_frontier = []
+        meeting = None
+        for person in frontier:
+            if stats is not None:
+                stats.expanded += 1
+                if person not in self.costar_cache:
+                    stats.neighbor_sets += 1
+            for movie, neighbor in self.costars(person):
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = (movie, person)
+                next_frontier.append(neighbor)
+                if meeting is None and neighbor in other_parents:
+                    meeting = neighbor
+        return next_frontier, meeting
+
+
+class StringTable():
+    """
+    Sequence of strings stored as one UTF-8 blob: string `i` is
+    `data[offsets[i]:offsets[i + 1]]`, decoded only when it is read.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        """
+        Build a table from a sequence of strings.
+        """
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = array("q", [0])
+        total = 0
+        for data in encoded:
+            total += len(data)
+            offsets.append(total)
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class BFSTree():
+    """
+    Distances and parent pointers of a breadth-first search from `source`.
+    Unreached people have a distance and parents of -1.
+    """
+
+    def __init__(self, source, size):
+        self.source = source
+        self.distances = array("i", [-1]) * size
+        self.parent_people = array("q", [-1]) * size
+        self.parent_movies = array("q", [-1]) * size
+
+    def nbytes(self):
+        """
+        Returns the memory used by the tree's arrays.
+        """
+        return sum(
+            len(values) * values.itemsize
+            for values in (self.distances, self.parent_people,
+                           self.parent_movies)
+        )
+
+    def path_from(self, person):
+        """
+        Returns the list of (movie, person) index pairs that lead from
+        `person` back to the source, or None if the source is not reachable.
+        """
+        if self.distances[person] == -1:
+            return None
+        pairs = []
+        while person != self.source:
+            pairs.append((self.parent_movies[person],
+                          self.parent_people[person]))
+            person = self.parent_people[person]
+        return pairs
+
+    def path_to(self, person):
+        """
+        Returns the list of (movie, person) index pairs that lead from
+        the source to `person`, or None if `person` is not reachable.
+        """
+        if self.distances[person] == -1:
+            return None
+        pairs = []
+        while person != self.source:
+            pairs.append((self.parent_movies[person], person))
+            person = self.parent_people[person]
+        pairs.reverse()
+        return pairs
+
+
+class TreeCache():
+    """
+    Least-recently-used cache of BFS trees for frequently queried people,
+    holding at most `max_bytes` worth of trees.
+    """
+
+    def __init__(self, graph, max_bytes=TREE_CACHE_BYTES,
+                 hot_queries=HOT_SOURCE_QUERIES):
+        self.graph = graph
+        self.max_bytes = max_bytes
+        self.hot_queries = hot_queries
+        self.trees = OrderedDict()
+        self.nbytes = 0
+
+        # Number of queries seen for each source not yet cached
+        self.queries = {}
+
+    def get(self, person):
+        """
+        Returns the cached tree rooted at `person`, or None.
+        """
+        tree = self.trees.get(person)
+        if tree is not None:
+            self.trees.move_to_end(person)
+        return tree
+
+    def add(self, tree):
+        """
+        Cache `tree`, evicting the least recently used trees to stay
+        within the memory budget. Trees larger than the budget are dropped.
+        """
+        size = tree.nbytes()
+        if size > self.max_bytes:
+            return
+        while self.nbytes + size > self.max_bytes:
+            _, evicted = self.trees.popitem(last=False)
+            self.nbytes -= evicted.nbytes()
+        self.trees[tree.source] = tree
+        self.nbytes += size
+
+    def shortest_path(self, source, target, stats=None):
+        """
+        Returns the shortest list of (movie, person) index pairs
+        that connect the source to the target, or None if not connected.
+        If a `SearchStats` is given, the work done is counted in it.
+
+        Uses a cached tree rooted at either end when there is one, and
+        builds a tree for the source once it has been queried often enough.
+        """
+        if not self.graph.connected(source, target):
+            return None
+
+        tree = self.get(source)
+        if tree is not None:
+            return tree.path_to(target)
+        tree = self.get(target)
+        if tree is not None:
+            return tree.path_from(source)
+
+        self.queries[source] = self.queries.get(source, 0) + 1
+        if self.queries[source] >= self.hot_queries:
+            del self.queries[source]
+            tree = self.graph.bfs_tree(source, stats)
+            self.add(tree)
+            return tree.path_to(target)
+        return self.graph.shortest_path(source, target, stats)
+
+
+def source_stats(directory):
+    """
+    Returns the size and modification time of each source CSV file,
+    used to tell whether a snapshot is still up to date.
+    """
+    stats = {}
+    for filename in SOURCE_FILES:
+        stat = os.stat(os.path.join(directory, filename))
+        stats[filename] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def find_id(ids, order, key):
+    """
+    Returns the index `i` such that `ids[i]` is `key`, by binary search
+    over `order`, the indices sorted by id. Raises KeyError if not found.
+    """
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if ids[order[middle]] < key:
+            low = middle + 1
+        else:
+            high = middle
+    if low == len(order) or ids[order[low]] != key:
+        raise KeyError(key)
+    return order[low]
+
+
+def to_csr(rows, columns, size):
+    """
+    Group the edges (rows[i], columns[i]) by row.
+    Returns the row offsets and the column of every edge in row order.
+    """
+    counts = array("q", bytes(8 * (size + 1)))
+    for row in rows:
+        counts[row + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+
+    offsets = array("q", counts)
+    values = array("q", bytes(8 * len(rows)))
+    for row, column in zip(rows, columns):
+        values[counts[row]] = column
+        counts[row] += 1
+    return offsets, values
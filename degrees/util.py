@@ -1,3 +1,13 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+
+# Most trigram postings counted, and candidate names checked by edit
+# distance, in one fuzzy lookup
+GRAM_BUDGET = 20000
+FUZZY_CANDIDATES = 50
+
+
 class Node():
     def __init__(self, state, parent, action):
         self.state = state
@@ -36,3 +46,189 @@ class QueueFrontier(StackFrontier):
             node = self.frontier[0]
             self.frontier = self.frontier[1:]
             return node
+
+
+class DequeStackFrontier():
+    def __init__(self):
+        self.frontier = deque()
+        # Number of queued nodes per state, for constant time lookups
+        self.states = {}
+
+    def add(self, node):
+        self.frontier.append(node)
+        self.states[node.state] = self.states.get(node.state, 0) + 1
+
+    def contains_state(self, state):
+        return state in self.states
+
+    def empty(self):
+        return len(self.frontier) == 0
+
+    def remove(self):
+        if self.empty():
+            raise Exception("empty frontier")
+        else:
+            node = self.pop()
+            if self.states[node.state] == 1:
+                del self.states[node.state]
+            else:
+                self.states[node.state] -= 1
+            return node
+
+    def pop(self):
+        return self.frontier.pop()
+
+
+class DequeQueueFrontier(DequeStackFrontier):
+
+    def pop(self):
+        return self.frontier.popleft()
+
+
+class NameIndex():
+    """
+    Index of names supporting prefix and fuzzy lookups.
+
+    `keys` are the sorted lowercase names. `grams` are the sorted trigrams
+    of the keys, and the positions in `keys` of the names containing
+    `grams[i]` are `positions[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, keys, grams, offsets, positions):
+        self.keys = keys
+        self.grams = grams
+        self.offsets = offsets
+        self.positions = positions
+
+    @classmethod
+    def from_names(cls, names):
+        """
+        Build an index over an iterable of lowercase names.
+        """
+        keys = sorted(names)
+        postings = {}
+        for position, key in enumerate(keys):
+            for gram in set(trigrams(key)):
+                postings.setdefault(gram, array("q")).append(position)
+        grams = sorted(postings)
+        offsets = array("q", [0])
+        positions = array("q")
+        for gram in grams:
+            positions.extend(postings[gram])
+            offsets.append(len(positions))
+        return cls(keys, grams, offsets, positions)
+
+    def postings(self, gram):
+        """
+        Returns the positions in `keys` of the names containing `gram`.
+        """
+        i = bisect_left(self.grams, gram)
+        if i == len(self.grams) or self.grams[i] != gram:
+            return ()
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def prefix(self, prefix, limit=10):
+        """
+        Returns up to `limit` names starting with `prefix`, in sorted order.
+        """
+        prefix = prefix.lower()
+        position = bisect_left(self.keys, prefix)
+        matches = []
+        while (position < len(self.keys) and len(matches) < limit and
+               self.keys[position].startswith(prefix)):
+            matches.append(self.keys[position])
+            position += 1
+        return matches
+
+    def fuzzy(self, name, max_distance=2, limit=10):
+        """
+        Returns up to `limit` (distance, name) pairs for names within
+        `max_distance` edits of `name`, closest first.
+
+        Only the rarest trigrams are counted, up to `GRAM_BUDGET` postings,
+        and only the `FUZZY_CANDIDATES` names sharing the most of them are
+        checked, so a name made only of common trigrams may be missed.
+        """
+        name = name.lower()
+        postings = sorted(
+            (self.postings(gram) for gram in set(trigrams(name))), key=len)
+
+        # Each edit destroys at most three trigrams, so a close enough name
+        # shares all but 3 * max_distance of those counted. Skipping common
+        # trigrams keeps the count cheap, at the cost of a weaker filter.
+        checked = []
+        total = 0
+        for posting in postings:
+            if total + len(posting) > GRAM_BUDGET:
+                break
+            checked.append(posting)
+            total += len(posting)
+        required = max(1, len(checked) - 3 * max_distance)
+        hits = Counter()
+        for posting in checked:
+            hits.update(posting)
+
+        # Check the candidates sharing the most trigrams first
+        matches = []
+        tried = 0
+        for position, count in hits.most_common():
+            if count < required or tried == FUZZY_CANDIDATES:
+                break
+            key = self.keys[position]
+            if abs(len(key) - len(name)) > max_distance:
+                continue
+            tried += 1
+            distance = edit_distance(name, key, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, key))
+        matches.sort()
+        return matches[:limit]
+
+
+def trigrams(text):
+    text = f"  {text} "
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+
+def edit_distance(a, b, limit):
+    """
+    Returns the Levenshtein distance between `a` and `b`,
+    or `limit + 1` as soon as it is known to exceed `limit`.
+    """
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class SearchStats():
+    """
+    Counters describing the work done by one search.
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.frontier_peak = 0
+        self.neighbor_sets = 0
+        self.elapsed = 0.0
+
+    def frontier_size(self, size):
+        if size > self.frontier_peak:
+            self.frontier_peak = size
+
+    def as_dict(self):
+        return {
+            "expanded": self.expanded,
+            "frontier_peak": self.frontier_peak,
+            "neighbor_sets": self.neighbor_sets,
+            "elapsed": self.elapsed
+        }
@@ -1,6 +1,15 @@
+import argparse
 import csv
+import functools
+import glob
 import itertools
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 PROBS = {
 
@@ -36,16 +45,237 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Possible numbers of copies of the gene
+GENES = (0, 1, 2)
+
+# Ways of computing the probabilities
+METHODS = ["junction-tree", "enumerate", "vectorized",
+           "likelihood-weighting", "gibbs"]
+
+# Assignments evaluated at once by the vectorized enumeration
+BATCH_SIZE = 4096
+
+# Shards of the enumeration per process, to even out the load
+SHARDS_PER_PROCESS = 4
+
+# Default budget and number of chains of the sampling methods
+SAMPLES = 100000
+CHAINS = 1000
+
+# Sweeps of each Gibbs chain discarded before counting samples
+BURN_IN = 100
+
+# Output formats of batch runs
+FORMATS = ["jsonl", "csv"]
+
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Infer gene and trait probabilities in a family.")
+    parser.add_argument("data", nargs="+",
+                        help="CSV file of the family, or with --batch, "
+                             "CSV files, directories of them or glob patterns")
+    parser.add_argument("--method", choices=METHODS, default="junction-tree",
+                        help="exact inference (junction-tree), or summing "
+                             "over every joint assignment one at a time "
+                             "(enumerate) or in NumPy batches (vectorized), "
+                             "or approximate inference by sampling "
+                             "(likelihood-weighting, gibbs)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="share the enumerate method's assignments "
+                             "out across this many processes")
+    parser.add_argument("--samples", type=int, default=SAMPLES,
+                        help="samples drawn by the sampling methods")
+    parser.add_argument("--time-limit", type=float,
+                        help="stop sampling after this many seconds")
+    parser.add_argument("--chains", type=int, default=CHAINS,
+                        help="samples drawn at once by likelihood "
+                             "weighting, or Gibbs chains run side by side")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch", action="store_true",
+                        help="run every family given, writing one result "
+                             "per family to a single output")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl",
+                        help="format of batch results")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write batch results to FILE "
+                             "instead of standard output")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes running batch families")
+    args = parser.parse_args()
+    options = {"method": args.method, "samples": args.samples,
+               "time_limit": args.time_limit, "chains": args.chains,
+               "seed": args.seed}
+
+    if args.batch:
+        filenames = family_files(args.data)
+        if args.output is None:
+            run_batch(filenames, sys.stdout, args.format, args.workers,
+                      **options)
+        else:
+            with open(args.output, "w", newline="") as f:
+                run_batch(filenames, f, args.format, args.workers, **options)
+        return
+    if len(args.data) > 1:
+        parser.error("give one family, or use --batch to run several")
+    people = load_data(args.data[0])
+
+    # Keep track of gene and trait probabilities for each person,
+    # and of their standard errors when they are estimated by sampling
+    try:
+        probabilities, errors = compute_probabilities(
+            people, processes=args.processes, **options)
+    except ValueError as e:
+        sys.exit(f"{args.data[0]}: {e}")
 
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                if errors is None:
+                    print(f"    {value}: {p:.4f}")
+                else:
+                    error = errors[person][field][value]
+                    print(f"    {value}: {p:.4f} ± {error:.4f}")
+
+
+def compute_probabilities(people, method="junction-tree", processes=1,
+                          samples=SAMPLES, time_limit=None, chains=CHAINS,
+                          seed=None):
+    """
+    Return the gene and trait distribution of everyone in `people`,
+    computed by `method`, and the standard errors of the probabilities if
+    they are estimated by sampling (None otherwise).
+    """
+    if method == "likelihood-weighting":
+        return likelihood_weighting(people, samples, time_limit, chains, seed)
+    elif method == "gibbs":
+        return gibbs_sampling(people, samples, time_limit, chains, seed)
+    elif method == "enumerate" and processes > 1:
+        return parallel_enumerate_probabilities(people, processes), None
+    elif method == "enumerate":
+        return enumerate_probabilities(people), None
+    elif method == "vectorized":
+        return vectorized_probabilities(people), None
+    return infer(people), None
+
+
+def family_files(patterns):
+    """
+    Return the family CSV files named by `patterns`: files, directories
+    (meaning every CSV file in them) or glob patterns, in sorted order
+    within each pattern. A pattern matching nothing is kept as it is,
+    so that it is reported as a missing family.
+    """
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.csv")
+        filenames.extend(sorted(glob.glob(pattern)) or [pattern])
+    return filenames
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
+
+def run_batch(filenames, output, form="jsonl", workers=1, **options):
+    """
+    Compute the probabilities of every family in `filenames` and write them
+    to `output`, in the same order as the files: one JSON object per family,
+    or one CSV row per person. `options` are passed on to `run_family`.
+
+    With more than one worker, families are run by a process pool. The
+    probability tables shared by every family are built before the pool
+    starts, so workers inherit them when processes are forked, and build
+    them once each otherwise.
+    """
+    init_batch_worker()
+    run = functools.partial(run_family, **options)
+    sampled = options.get("method") in ("likelihood-weighting", "gibbs")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_batch_worker) as executor:
+            write_results(executor.map(run, filenames), output, form, sampled)
+    else:
+        write_results(map(run, filenames), output, form, sampled)
+
+
+def init_batch_worker():
+    """
+    Build the probability tables shared by every family in this process.
+    """
+    inheritance_table()
+    log_tables()
+
+
+def run_family(filename, **options):
+    """
+    Load the family in `filename` and compute its probabilities with
+    `compute_probabilities` and `options`.
+
+    Returns a dictionary with the family's file name, the method used and
+    the seconds it took, the probabilities of everyone (and their standard
+    errors, when sampled), or an error message.
+    """
+    result = {"family": filename, "method": options.get("method",
+                                                        "junction-tree")}
+    start = time.perf_counter()
+    try:
+        people = load_data(filename)
+        probabilities, errors = compute_probabilities(people, **options)
+    except (OSError, KeyError, ValueError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    result["seconds"] = time.perf_counter() - start
+    result["probabilities"] = probabilities
+    if errors is not None:
+        result["errors"] = errors
+    return result
+
+
+def write_results(results, output, form, sampled=False):
+    """
+    Write batch `results` to `output` as JSON lines, or as CSV with one row
+    per person (and a row with only the error for families that failed),
+    including standard error columns if the probabilities were `sampled`.
+    """
+    if form == "jsonl":
+        for result in results:
+            print(json.dumps(result), file=output, flush=True)
+        return
+
+    columns = [f"{field}_{str(value).lower()}"
+               for field, values in (("gene", GENES[::-1]),
+                                     ("trait", (True, False)))
+               for value in values]
+    fieldnames = ["family", "person"] + columns
+    if sampled:
+        fieldnames += [f"{column}_error" for column in columns]
+    writer = csv.DictWriter(output, fieldnames + ["error"], restval="")
+    writer.writeheader()
+    for result in results:
+        if "error" in result:
+            writer.writerow({"family": result["family"],
+                             "error": result["error"]})
+            continue
+        for person, table in result["probabilities"].items():
+            row = {"family": result["family"], "person": person}
+            for field in table:
+                for value, p in table[field].items():
+                    column = f"{field}_{str(value).lower()}"
+                    row[column] = p
+                    if sampled:
+                        row[f"{column}_error"] = (
+                            result["errors"][person][field][value])
+            writer.writerow(row)
+        output.flush()
+
+
+def empty_probabilities(people):
+    """
+    Return a table of gene and trait probabilities of 0 for everyone.
+    """
+    return {
         person: {
             "gene": {
                 2: 0,
@@ -60,38 +290,85 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
 
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+def enumerate_probabilities(people):
+    """
+    Return the gene and trait distribution of everyone in `people`,
+    by summing the joint probability of every assignment consistent
+    with the known traits.
+    """
+    probabilities = enumerate_shard(people)
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+def enumerate_shard(people, shard=0, shards=1):
+    """
+    Return the unnormalized gene and trait probabilities of everyone in
+    `people`, summed over shard number `shard` of `shards` of the
+    assignments consistent with the known traits.
+    """
+    probabilities = empty_probabilities(people)
+
+    # Update probabilities with the joint probability of every assignment
+    for one_gene, two_genes, have_trait in assignments(people, shard, shards):
+        p = joint_probability(people, one_gene, two_genes, have_trait)
+        update(probabilities, one_gene, two_genes, have_trait, p)
+    return probabilities
+
+
+def parallel_enumerate_probabilities(people, processes=None, shards=None):
+    """
+    Return the gene and trait distribution of everyone in `people`, as
+    `enumerate_probabilities` does, with the assignments split into
+    `shards` enumerated on a pool of `processes` (by default, one per core).
+    """
+    if shards is None:
+        shards = (processes or os.cpu_count() or 1) * SHARDS_PER_PROCESS
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=init_enumerator,
+                             initargs=(people,)) as executor:
+        tasks = [(shard, shards) for shard in range(shards)]
+        probabilities = empty_probabilities(people)
+        for partial in executor.map(run_shard, tasks):
+            merge(probabilities, partial)
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
+    return probabilities
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
+
+# Family enumerated by the processes of a pool
+enumerator_people = None
+
+
+def init_enumerator(people):
+    """
+    Store the family in an enumerating process.
+    """
+    global enumerator_people
+    enumerator_people = people
+
+
+def run_shard(task):
+    """
+    Enumerate one (shard, shards) share of the assignments.
+    """
+    shard, shards = task
+    return enumerate_shard(enumerator_people, shard, shards)
+
+
+def merge(probabilities, partial):
+    """
+    Add the unnormalized probabilities in `partial` to `probabilities`.
+    """
+    for person in probabilities:
         for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
             for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+                probabilities[person][field][value] += (
+                    partial[person][field][value])
 
 
 def load_data(filename):
@@ -118,14 +395,42 @@ def load_data(filename):
 
 def powerset(s):
     """
-    Return a list of all possible subsets of set s.
+    Generate all possible subsets of set s, one at a time.
     """
     s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
-    ]
+    for subset in itertools.chain.from_iterable(
+        itertools.combinations(s, r) for r in range(len(s) + 1)
+    ):
+        yield set(subset)
+
+
+def assignments(people, shard=0, shards=1):
+    """
+    Generate every (one_gene, two_genes, have_trait) assignment
+    consistent with the known traits of `people`, or only those in
+    shard number `shard` of `shards` roughly equal shards.
+
+    Known traits are fixed, so only the traits of the other people are
+    enumerated; gene counts are drawn directly for each person rather
+    than from pairs of subsets.
+    """
+    names = list(people)
+    known = {person for person in names if people[person]["trait"]}
+    unknown = {person for person in names if people[person]["trait"] is None}
+    for traits in powerset(unknown):
+        have_trait = known | traits
+        for gene_counts in itertools.islice(
+            itertools.product(GENES, repeat=len(names)), shard, None, shards
+        ):
+            one_gene = {
+                person for person, gene_count in zip(names, gene_counts)
+                if gene_count == 1
+            }
+            two_genes = {
+                person for person, gene_count in zip(names, gene_counts)
+                if gene_count == 2
+            }
+            yield one_gene, two_genes, have_trait
 
 
 def joint_probability(people, one_gene, two_genes, have_trait):
@@ -205,5 +510,565 @@ def normalize(probabilities):
             probabilities[person]["trait"][trait_type] *= trait_factor
 
 
+def vectorized_probabilities(people, batch_size=BATCH_SIZE):
+    """
+    Return the gene and trait distribution of everyone in `people`,
+    as `enumerate_probabilities` does, evaluating `batch_size` joint
+    assignments at a time with NumPy.
+
+    Assignments are numbered, and decoded into arrays of gene counts
+    (one base-3 digit per person) and of traits for the people whose
+    trait is unknown (one base-2 digit each); known traits are fixed.
+    """
+    names, mothers, fathers, traits = encode_family(people)
+    size = len(names)
+    founders = (mothers == -1) | (fathers == -1)
+    unknown = np.flatnonzero(traits == -1)
+    observed = traits == 1
+
+    log_gene, log_inherit, log_trait = log_tables()
+    gene_totals = np.zeros(size * 3)
+    trait_totals = np.zeros(size * 2)
+    offset = -np.inf
+
+    count = 3 ** size * 2 ** len(unknown)
+    for start in range(0, count, batch_size):
+        numbers = np.arange(start, min(start + batch_size, count),
+                            dtype=np.int64)
+
+        # Decode each number into gene counts and unknown traits
+        genes = np.empty((len(numbers), size), dtype=np.int64)
+        for person in range(size):
+            genes[:, person] = numbers % 3
+            numbers = numbers // 3
+        traits = np.broadcast_to(observed, genes.shape).copy()
+        for person in unknown:
+            traits[:, person] = numbers % 2
+            numbers = numbers // 2
+
+        # Log joint probability of every assignment in the batch
+        log_p = np.where(
+            founders,
+            log_gene[genes],
+            log_inherit[genes[:, mothers], genes[:, fathers], genes]
+        )
+        log_p = (log_p + log_trait[genes, traits.astype(np.int64)]).sum(axis=1)
+
+        # Accumulate relative to the largest log probability so far
+        if log_p.max() > offset:
+            scale = np.exp(offset - log_p.max())
+            gene_totals *= scale
+            trait_totals *= scale
+            offset = log_p.max()
+        weights = np.repeat(np.exp(log_p - offset), size)
+        people_index = np.tile(np.arange(size), len(log_p))
+        gene_totals += np.bincount(people_index * 3 + genes.ravel(),
+                                   weights=weights, minlength=size * 3)
+        trait_totals += np.bincount(people_index * 2 + traits.ravel(),
+                                    weights=weights, minlength=size * 2)
+
+    probabilities = to_probabilities(people, names,
+                                     gene_totals.reshape(size, 3),
+                                     trait_totals.reshape(size, 2))
+    normalize(probabilities)
+    return probabilities
+
+
+def encode_family(people):
+    """
+    Return the names of everyone in `people`, ordered so that parents come
+    before their children, and arrays of each person's mother and father
+    (as positions in that order, or -1 if unknown) and trait (1 or 0, or
+    -1 if unknown).
+    """
+    names = []
+    placed = set()
+
+    def place(name):
+        if name in placed:
+            return
+        for parent in (people[name]["mother"], people[name]["father"]):
+            if parent is not None:
+                place(parent)
+        placed.add(name)
+        names.append(name)
+
+    for name in people:
+        place(name)
+
+    index = {name: i for i, name in enumerate(names)}
+    mothers = np.array([index.get(people[name]["mother"], -1)
+                        for name in names], dtype=np.int64)
+    fathers = np.array([index.get(people[name]["father"], -1)
+                        for name in names], dtype=np.int64)
+    traits = np.array([-1 if people[name]["trait"] is None
+                       else int(people[name]["trait"])
+                       for name in names], dtype=np.int64)
+    return names, mothers, fathers, traits
+
+
+def to_probabilities(people, names, genes, traits):
+    """
+    Return a table of gene and trait probabilities for everyone in
+    `people`, from arrays with a row per name in `names`, indexed by gene
+    count and by trait (0 or 1).
+    """
+    probabilities = empty_probabilities(people)
+    for i, name in enumerate(names):
+        for gene_count in GENES:
+            probabilities[name]["gene"][gene_count] = float(
+                genes[i, gene_count])
+        for trait_value in (True, False):
+            probabilities[name]["trait"][trait_value] = float(
+                traits[i, int(trait_value)])
+    return probabilities
+
+
+@functools.cache
+def log_tables():
+    """
+    Return `PROBS` as read-only log probability arrays: of a gene count for
+    someone without parents, indexed by gene count; of a child's gene count,
+    indexed by mother's, father's and child's gene counts; and of a trait,
+    indexed by gene count and trait (0 or 1).
+
+    The arrays are computed once per process.
+    """
+    inheritance = inheritance_table()
+    with np.errstate(divide="ignore"):
+        log_gene = np.log([PROBS["gene"][gene_count] for gene_count in GENES])
+        log_inherit = np.log([
+            [
+                [inheritance[mother, father, gene_count]
+                 for gene_count in GENES]
+                for father in GENES
+            ]
+            for mother in GENES
+        ])
+        log_trait = np.log([
+            [PROBS["trait"][gene_count][False],
+             PROBS["trait"][gene_count][True]]
+            for gene_count in GENES
+        ])
+    for table in (log_gene, log_inherit, log_trait):
+        table.setflags(write=False)
+    return log_gene, log_inherit, log_trait
+
+
+def infer(people):
+    """
+    Return the gene and trait distribution of everyone in `people`,
+    as `enumerate_probabilities` does, by message passing on a
+    junction tree of the pedigree.
+
+    Each person's gene count depends only on their parents' gene counts,
+    and their trait only on their own gene count, so the joint
+    distribution factors into one small factor per person. Cliques are
+    found by variable elimination, and two passes of messages over them
+    give every person's distribution at once, in time exponential only
+    in the width of the pedigree instead of in the size of the family.
+    """
+    factors = gene_factors(people)
+    order, cliques, parents = junction_tree(factors)
+
+    # Give every factor to the first clique that contains its scope
+    position = {var: i for i, var in enumerate(order)}
+    assigned = {var: [] for var in order}
+    for factor in factors:
+        assigned[min(factor[0], key=position.get)].append(factor)
+    children = {var: [] for var in order}
+    for var in order:
+        if parents[var] is not None:
+            children[parents[var]].append(var)
+
+    def separator(var):
+        return cliques[var] - {var}
+
+    # Collect messages from the leaves up (children are eliminated first)
+    up = {}
+    for var in order:
+        if parents[var] is not None:
+            incoming = assigned[var] + [up[child] for child in children[var]]
+            up[var] = marginalize(multiply_all(incoming), separator(var))
+
+    # Distribute messages from the roots back down
+    down = {}
+    for var in reversed(order):
+        for child in children[var]:
+            incoming = assigned[var] + [
+                up[other] for other in children[var] if other != child]
+            if parents[var] is not None:
+                incoming.append(down[var])
+            down[child] = marginalize(multiply_all(incoming), separator(child))
+
+    probabilities = empty_probabilities(people)
+    for person in people:
+        incoming = assigned[person] + [
+            up[child] for child in children[person]]
+        if parents[person] is not None:
+            incoming.append(down[person])
+        unit = ((person,), {(gene_count,): 1 for gene_count in GENES})
+        variables, table = marginalize(
+            multiply_all([unit] + incoming), {person})
+        for gene_count in GENES:
+            probabilities[person]["gene"][gene_count] = table[(gene_count,)]
+
+        # A known trait is certain, an unknown one depends on the gene
+        trait = people[person]["trait"]
+        for trait_value in (True, False):
+            if trait is not None:
+                p = 1 if trait == trait_value else 0
+            else:
+                p = sum(
+                    table[(gene_count,)] *
+                    PROBS["trait"][gene_count][trait_value]
+                    for gene_count in GENES
+                )
+            probabilities[person]["trait"][trait_value] = p
+    return probabilities
+
+
+def inheritance_probability(gene_count, mother_genes, father_genes):
+    """
+    Return the probability that a child has `gene_count` copies of the
+    gene, given how many copies their mother and father have.
+    """
+    def pass_prob(parent_genes):
+        if parent_genes == 2:
+            return 1 - PROBS["mutation"]
+        elif parent_genes == 1:
+            return 0.5
+        else:
+            return PROBS["mutation"]
+
+    mother = pass_prob(mother_genes)
+    father = pass_prob(father_genes)
+    if gene_count == 2:
+        return mother * father
+    elif gene_count == 1:
+        return mother * (1 - father) + (1 - mother) * father
+    else:
+        return (1 - mother) * (1 - father)
+
+
+@functools.cache
+def inheritance_table():
+    """
+    Return a dictionary mapping each (mother's, father's, child's) tuple of
+    gene counts to the probability of the child's gene count.
+
+    The table is computed once per process, and shared by every family.
+    """
+    return {
+        (mother_genes, father_genes, gene_count):
+            inheritance_probability(gene_count, mother_genes, father_genes)
+        for mother_genes, father_genes, gene_count
+        in itertools.product(GENES, repeat=3)
+    }
+
+
+def gene_factors(people):
+    """
+    Return one factor per person over the gene counts of that person
+    (and their parents, if known), combining the probability of their gene
+    count given their parents' with the probability of their known trait.
+
+    A factor is a pair of a tuple of people and a dictionary mapping each
+    tuple of their gene counts to a probability.
+    """
+    inheritance = inheritance_table()
+    factors = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        trait = people[person]["trait"]
+
+        def evidence(gene_count):
+            if trait is None:
+                return 1
+            return PROBS["trait"][gene_count][trait]
+
+        if not mother or not father:
+            factors.append(((person,), {
+                (gene_count,): PROBS["gene"][gene_count] * evidence(gene_count)
+                for gene_count in GENES
+            }))
+        else:
+            factors.append(((mother, father, person), {
+                genes: p * evidence(genes[2])
+                for genes, p in inheritance.items()
+            }))
+    return factors
+
+
+def multiply(first, second):
+    """
+    Return the product of two factors.
+    """
+    first_vars, first_table = first
+    second_vars, second_table = second
+    variables = first_vars + tuple(
+        var for var in second_vars if var not in first_vars)
+    first_positions = [variables.index(var) for var in first_vars]
+    second_positions = [variables.index(var) for var in second_vars]
+    table = {}
+    for assignment in itertools.product(GENES, repeat=len(variables)):
+        table[assignment] = (
+            first_table[tuple(assignment[i] for i in first_positions)] *
+            second_table[tuple(assignment[i] for i in second_positions)]
+        )
+    return variables, table
+
+
+def multiply_all(factors):
+    """
+    Return the product of a list of factors.
+    """
+    product = ((), {(): 1})
+    for factor in factors:
+        product = multiply(product, factor)
+    return product
+
+
+def marginalize(factor, keep):
+    """
+    Return `factor` with every variable not in `keep` summed out,
+    scaled to sum to 1 so that long chains of messages cannot underflow.
+    """
+    variables, table = factor
+    positions = [i for i, var in enumerate(variables) if var in keep]
+    summed = {}
+    for assignment, p in table.items():
+        rest = tuple(assignment[i] for i in positions)
+        summed[rest] = summed.get(rest, 0) + p
+    total = sum(summed.values())
+    return (
+        tuple(variables[i] for i in positions),
+        {assignment: p / total for assignment, p in summed.items()}
+    )
+
+
+def junction_tree(factors):
+    """
+    Return an elimination order of the variables of `factors`, and for
+    each variable the clique formed when it is eliminated and the parent
+    of that clique in the junction tree (None for a root).
+
+    Variables are eliminated greedily, always choosing the one with
+    the fewest neighbors, which keeps the cliques small.
+    """
+    neighbors = {}
+    for variables, _ in factors:
+        for var in variables:
+            neighbors.setdefault(var, set()).update(variables)
+    for var in neighbors:
+        neighbors[var].discard(var)
+
+    order = []
+    cliques = {}
+    while neighbors:
+        var = min(neighbors, key=lambda var: len(neighbors[var]))
+        adjacent = neighbors.pop(var)
+        for other in adjacent:
+            neighbors[other].discard(var)
+            neighbors[other].update(adjacent - {other})
+        order.append(var)
+        cliques[var] = adjacent | {var}
+
+    # A clique hangs off the clique of its first neighbor eliminated next
+    position = {var: i for i, var in enumerate(order)}
+    parents = {
+        var: min(cliques[var] - {var}, key=position.get)
+        if len(cliques[var]) > 1 else None
+        for var in order
+    }
+    return order, cliques, parents
+
+
+def likelihood_weighting(people, samples=SAMPLES, time_limit=None,
+                         chains=CHAINS, seed=None):
+    """
+    Estimate the gene and trait distribution of everyone in `people` by
+    likelihood weighting: draw gene counts and unknown traits from `PROBS`,
+    parents before children, and weight each sample by the probability of
+    the known traits.
+
+    Draw `chains` samples at a time until `samples` have been drawn or
+    `time_limit` seconds have passed. Return a table of probabilities and
+    a table of their standard errors.
+
+    The more traits are known, the fewer samples carry most of the weight,
+    so prefer `gibbs_sampling` for large pedigrees with many known traits.
+    """
+    names, mothers, fathers, traits = encode_family(people)
+    log_gene, log_inherit, log_trait = log_tables()
+    generator = np.random.default_rng(seed)
+    size = len(names)
+
+    # Sums of weights, of squared weights, and of both over the samples
+    # with each gene count and trait, relative to a running log offset
+    weights = np.zeros(2)
+    gene_sums = np.zeros((2, size, 3))
+    trait_sums = np.zeros((2, size, 2))
+    offset = -np.inf
+
+    start = time.perf_counter()
+    drawn = 0
+    while drawn < samples and not out_of_time(start, time_limit):
+        batch = min(chains, samples - drawn)
+        genes = np.empty((batch, size), dtype=np.int64)
+        sampled = np.broadcast_to(traits, genes.shape).copy()
+        log_w = np.zeros(batch)
+        for person in range(size):
+            if mothers[person] == -1 or fathers[person] == -1:
+                log_p = np.broadcast_to(log_gene, (batch, 3))
+            else:
+                log_p = log_inherit[genes[:, mothers[person]],
+                                    genes[:, fathers[person]]]
+            genes[:, person] = sample(generator, log_p)
+            if traits[person] == -1:
+                sampled[:, person] = sample(
+                    generator, log_trait[genes[:, person]])
+            else:
+                log_w += log_trait[genes[:, person], traits[person]]
+        drawn += batch
+
+        # Rescale the sums if this batch has a larger weight
+        if log_w.max() > offset:
+            scale = np.exp(offset - log_w.max())
+            scales = np.array([scale, scale ** 2])
+            weights *= scales
+            gene_sums *= scales[:, np.newaxis, np.newaxis]
+            trait_sums *= scales[:, np.newaxis, np.newaxis]
+            offset = log_w.max()
+        w = np.exp(log_w - offset)
+        w = np.stack([w, w ** 2])
+        weights += w.sum(axis=1)
+        gene_sums += np.einsum("kb,bpv->kpv", w, np.eye(3)[genes])
+        trait_sums += np.einsum("kb,bpv->kpv", w, np.eye(2)[sampled])
+
+    if drawn == 0:
+        raise ValueError("no samples drawn within the time limit")
+
+    # Self-normalized estimates, with the delta-method variance
+    # sum(w^2 (x - p)^2) / sum(w)^2 of an indicator x
+    gene_p = gene_sums[0] / weights[0]
+    trait_p = trait_sums[0] / weights[0]
+    gene_error = np.sqrt(np.maximum(
+        gene_sums[1] * (1 - 2 * gene_p) + gene_p ** 2 * weights[1], 0
+    )) / weights[0]
+    trait_error = np.sqrt(np.maximum(
+        trait_sums[1] * (1 - 2 * trait_p) + trait_p ** 2 * weights[1], 0
+    )) / weights[0]
+    return (to_probabilities(people, names, gene_p, trait_p),
+            to_probabilities(people, names, gene_error, trait_error))
+
+
+def gibbs_sampling(people, samples=SAMPLES, time_limit=None,
+                   chains=CHAINS, seed=None, burn_in=BURN_IN):
+    """
+    Estimate the gene and trait distribution of everyone in `people` by
+    Gibbs sampling, running `chains` chains side by side. Each sweep
+    redraws every person's gene count given their parents', their
+    children's and their trait, then their trait if it is unknown.
+
+    Discard the first `burn_in` sweeps, then sweep until `samples` samples
+    have been counted over all chains or `time_limit` seconds have passed.
+    Return a table of probabilities and a table of their standard errors,
+    from the spread of the estimates of the independent chains.
+    """
+    if chains < 2:
+        raise ValueError("at least two chains are needed")
+    names, mothers, fathers, traits = encode_family(people)
+    log_gene, log_inherit, log_trait = log_tables()
+    generator = np.random.default_rng(seed)
+    size = len(names)
+
+    # Start every chain from a sample of the prior with the known traits
+    genes = np.empty((chains, size), dtype=np.int64)
+    for person in range(size):
+        if mothers[person] == -1 or fathers[person] == -1:
+            log_p = np.broadcast_to(log_gene, (chains, 3))
+        else:
+            log_p = log_inherit[genes[:, mothers[person]],
+                                genes[:, fathers[person]]]
+        genes[:, person] = sample(generator, log_p)
+    sampled = np.where(traits == -1, 0, traits)
+    sampled = np.broadcast_to(sampled, genes.shape).copy()
+
+    # Children of each person, and whether the person is their mother
+    children = [[] for _ in range(size)]
+    for child in range(size):
+        if mothers[child] != -1 and fathers[child] != -1:
+            children[mothers[child]].append((child, True))
+            children[fathers[child]].append((child, False))
+
+    gene_counts = np.zeros((chains, size, 3))
+    trait_counts = np.zeros((chains, size, 2))
+    start = time.perf_counter()
+    sweeps = 0
+    while (sweeps - burn_in) * chains < samples:
+        if out_of_time(start, time_limit):
+            break
+        for person in range(size):
+            if mothers[person] == -1 or fathers[person] == -1:
+                log_p = np.tile(log_gene, (chains, 1))
+            else:
+                log_p = log_inherit[genes[:, mothers[person]],
+                                    genes[:, fathers[person]]].copy()
+            log_p += log_trait[:, sampled[:, person]].T
+            for child, is_mother in children[person]:
+                child_genes = genes[:, child]
+                if is_mother:
+                    log_p += log_inherit[:, genes[:, fathers[child]],
+                                         child_genes].T
+                else:
+                    log_p += log_inherit[genes[:, mothers[child]], :,
+                                         child_genes]
+            genes[:, person] = sample(generator, log_p)
+            if traits[person] == -1:
+                sampled[:, person] = sample(
+                    generator, log_trait[genes[:, person]])
+        sweeps += 1
+        if sweeps > burn_in:
+            gene_counts += np.eye(3)[genes]
+            trait_counts += np.eye(2)[sampled]
+
+    kept = sweeps - burn_in
+    if kept <= 0:
+        raise ValueError("burn-in did not finish within the time limit")
+
+    # Treat each chain's estimate as one observation of the probabilities
+    gene_estimates = gene_counts / kept
+    trait_estimates = trait_counts / kept
+    return (
+        to_probabilities(people, names, gene_estimates.mean(axis=0),
+                         trait_estimates.mean(axis=0)),
+        to_probabilities(people, names,
+                         gene_estimates.std(axis=0, ddof=1) / np.sqrt(chains),
+                         trait_estimates.std(axis=0, ddof=1) / np.sqrt(chains))
+    )
+
+
+def sample(generator, log_p):
+    """
+    Return one draw per row of `log_p`, an array of unnormalized log
+    probabilities of 0, 1, 2, ...
+    """
+    # Work on columns, as reducing over short rows is slow in NumPy
+    columns = np.ascontiguousarray(log_p.T)
+    p = np.exp(columns - np.maximum.reduce(columns))
+    cumulative = np.add.accumulate(p)
+    u = generator.random(len(log_p)) * cumulative[-1]
+    return (u >= cumulative[:-1]).sum(axis=0)
+
+
+def out_of_time(start, time_limit):
+    """
+    Return True if `time_limit` seconds (if any) have passed since `start`.
+    """
+    return time_limit is not None and time.perf_counter() - start > time_limit
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,63 @@
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from generate import DISTRIBUTIONS, generate_corpus
+from pagerank import (DAMPING, SAMPLES, crawl_graph, iterate_pagerank,
+                      sample_pagerank)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark PageRank on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 10000])
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument("--mean-links", type=float, default=8)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS,
+                        default="power-law")
+    parser.add_argument("--dangling", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'pages':>8}{'step':>12}{'seconds':>10}{'peak MB':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_corpus(directory, size, args.mean_links,
+                            args.distribution, args.dangling, args.seed)
+
+            # Crawl in this process, since tracemalloc cannot see the
+            # memory of the crawler's worker processes
+            graph = measure(size, "crawl", crawl_graph, directory, 1)
+            sampled = measure(size, "sample", sample_pagerank,
+                              graph, DAMPING, args.samples)
+            iterated = measure(size, "iterate", iterate_pagerank,
+                               graph, DAMPING)
+
+        errors = [abs(sampled[page] - iterated[page]) for page in graph.pages]
+        print(f"{size:>8}{'error':>12}  L1 {sum(errors):.4f}, "
+              f"max {max(errors):.4f}")
+
+
+def measure(size, step, function, *args):
+    """
+    Run `function` on `args`, printing its running time and the peak
+    memory allocated while it ran. Returns what `function` returns.
+
+    Memory is traced in a second run, since tracing slows Python down.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{size:>8}{step:>12}{elapsed:>10.3f}{peak / 2 ** 20:>10.1f}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
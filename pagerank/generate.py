@@ -0,0 +1,120 @@
+import argparse
+import os
+
+import numpy as np
+
+DISTRIBUTIONS = ["power-law", "poisson"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic corpus of linked HTML pages.")
+    parser.add_argument("directory")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--mean-links", type=float, default=8,
+                        help="average number of links on a page "
+                             "that has any")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS,
+                        default="power-law",
+                        help="distribution of the number of links per page")
+    parser.add_argument("--dangling", type=float, default=0.05,
+                        help="fraction of pages without any links")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_corpus(args.directory, args.pages, args.mean_links,
+                    args.distribution, args.dangling, args.seed)
+
+
+def generate_corpus(directory, pages, mean_links=8, distribution="power-law",
+                    dangling=0.05, seed=0):
+    """
+    Write `pages` HTML pages named 0.html, 1.html, ... to `directory`.
+
+    A `dangling` fraction of the pages have no links. The number of links
+    on every other page follows `distribution` with mean `mean_links`:
+    "power-law" is a heavy-tailed Zipf distribution, "poisson" is narrow.
+    Link targets favor a few popular pages, as on the web, and no page
+    links to itself or to the same page twice.
+    """
+    generator = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # Popularity of each page as a link target falls off as 1 / rank
+    popularity = 1 / np.arange(1, pages + 1)
+    popularity = generator.permutation(popularity / popularity.sum())
+
+    degrees = link_counts(generator, pages, mean_links, distribution)
+    degrees[generator.random(pages) < dangling] = 0
+    degrees = np.minimum(degrees, pages - 1)
+    cumulative = np.cumsum(popularity)
+    for page, degree in enumerate(degrees):
+        targets = link_targets(generator, popularity, cumulative,
+                               page, degree)
+        links = "\n".join(
+            f'    <li><a href="{target}.html">Page {target}</a></li>'
+            for target in targets
+        )
+        with open(os.path.join(directory, f"{page}.html"), "w") as f:
+            f.write(PAGE.format(page=page, links=links))
+
+
+def link_targets(generator, popularity, cumulative, page, degree):
+    """
+    Return `degree` distinct pages other than `page`, drawn by popularity.
+
+    Targets are found by binary search in the `cumulative` popularity,
+    redrawing links to `page` itself and duplicates, so a page takes
+    O(degree log pages) time rather than O(pages). Pages linking to over
+    half the corpus are drawn exactly without replacement instead, since
+    redrawing would take long to reach the least popular pages.
+    """
+    pages = len(popularity)
+    if degree > pages // 2:
+        others = popularity.copy()
+        others[page] = 0
+        return generator.choice(pages, size=degree, replace=False,
+                                p=others / others.sum())
+
+    targets = {}
+    while len(targets) < degree:
+        draws = np.searchsorted(
+            cumulative, generator.random(degree - len(targets)) * cumulative[-1],
+            side="right")
+        for target in np.minimum(draws, pages - 1).tolist():
+            if target != page:
+                targets[target] = None
+    return list(targets)[:degree]
+
+
+def link_counts(generator, pages, mean_links, distribution):
+    """
+    Return the number of links on each page, drawn from `distribution`.
+    """
+    if distribution == "poisson":
+        return generator.poisson(mean_links, pages)
+    elif distribution == "power-law":
+        # Zipf with exponent 2.5 has mean zeta(1.5) / zeta(2.5) ~ 1.95,
+        # so scale it to the requested mean
+        counts = generator.zipf(2.5, pages) * mean_links / 1.95
+        return np.minimum(np.rint(counts), pages).astype(np.int64)
+    raise ValueError(f"unknown distribution: {distribution}")
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <title>Page {page}</title>
+</head>
+<body>
+    <h1>Page {page}</h1>
+    <ul>
+{links}
+    </ul>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,124 @@
+import argparse
+import hashlib
+import math
 import os
+import pickle
 import random
-import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+import numpy as np
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Bytes of HTML read and parsed at a time while crawling
+CHUNK_SIZE = 64 * 1024
+
+# File in a corpus directory holding the state of incremental ranking
+STATE_NAME = ".pagerank-state.pickle"
+STATE_VERSION = 1
+
+# Solvers for iterated PageRank, the default bound on the L1 residual,
+# and how often the extrapolation solvers extrapolate
+METHODS = ["jacobi", "gauss-seidel", "aitken", "quadratic"]
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 1000
+EXTRAPOLATION_PERIOD = 10
+
+# Binary edge lists: a header of MAGIC, the number of nodes and the
+# number of edges (int64), then (source, target) int32 pairs sorted by source
+EDGE_LIST_MAGIC = b"PREDGES\0"
+EDGE_DTYPE = np.dtype([("source", "<i4"), ("target", "<i4")])
+EDGE_BLOCK = 1 << 22
+
+# Pages kept for each seed set by personalized PageRank
+TOP_K = 10
+
+# Confidence level of the intervals reported for parallel sampling
+CONFIDENCE = 0.95
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
+    parser = argparse.ArgumentParser(description="Rank a corpus of pages.")
+    parser.add_argument("corpus",
+                        help="directory of HTML pages, or a binary edge "
+                             "list file with --edge-list")
+    parser.add_argument("--edge-list", action="store_true",
+                        help="rank the nodes of a binary edge list by "
+                             "streaming it from disk")
+    parser.add_argument("--walkers", type=int, default=1,
+                        help="sample with this many independent walkers "
+                             "spread over a process pool")
+    parser.add_argument("--seed", type=int,
+                        help="seed for reproducible parallel sampling")
+    parser.add_argument("--method", choices=METHODS, default="jacobi",
+                        help="solver used for iterated PageRank")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="stop iterating once the L1 residual "
+                             "is below this")
+    parser.add_argument("--personalize", metavar="FILE",
+                        help="rank pages for each line of seed pages "
+                             "(separated by spaces) in FILE")
+    parser.add_argument("--incremental", action="store_true",
+                        help="iterate from the ranks of the previous run, "
+                             "re-crawling only pages that changed")
+    args = parser.parse_args()
+
+    if args.edge_list:
+        result = stream_ranks(args.corpus, DAMPING, args.tolerance)
+        print(f"PageRank Results from Streaming Iteration "
+              f"({result.iterations} iterations, "
+              f"residual {result.residuals[-1]:.2e})")
+        for node in np.argsort(-result.ranks, kind="stable")[:10]:
+            print(f"  {node}: {result.ranks[node]:.4f}")
+        return
+
+    # Incremental runs only re-crawl the pages that changed
+    if args.incremental:
+        iterated, result, graph = incremental_pagerank(
+            args.corpus, DAMPING, args.method, args.tolerance)
+    else:
+        graph = crawl_graph(args.corpus)
+    if args.personalize:
+        with open(args.personalize) as f:
+            seed_sets = [line.split() for line in f if line.strip()]
+        if not seed_sets:
+            sys.exit(f"{args.personalize}: no seed sets")
+        try:
+            results = personalized_pagerank(
+                graph, DAMPING, seed_sets, tolerance=args.tolerance)
+        except ValueError as e:
+            sys.exit(f"{args.personalize}: {e}")
+        for seeds, ranks in zip(seed_sets, results):
+            print(f"Personalized PageRank Results for {', '.join(seeds)}")
+            for page in ranks:
+                print(f"  {page}: {ranks[page]:.4f}")
+        return
+
+    if args.walkers > 1:
+        ranks, intervals = parallel_sample_pagerank(
+            graph, DAMPING, SAMPLES, args.walkers, args.seed)
+        print(f"PageRank Results from Sampling (n = {SAMPLES}, "
+              f"walkers = {args.walkers})")
+        for page in sorted(ranks):
+            low, high = intervals[page]
+            print(f"  {page}: {ranks[page]:.4f} "
+                  f"({CONFIDENCE:.0%} CI {low:.4f} - {high:.4f})")
+    else:
+        ranks = sample_pagerank(graph, DAMPING, SAMPLES)
+        print(f"PageRank Results from Sampling (n = {SAMPLES})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+    if args.incremental:
+        ranks = iterated
+    else:
+        result = iterate_ranks(graph, DAMPING, args.method, args.tolerance)
+        ranks = graph.to_dict(result.ranks)
+    print(f"PageRank Results from Iteration ({args.method}, "
+          f"{result.iterations} iterations, "
+          f"residual {result.residuals[-1]:.2e})")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
 
@@ -26,27 +128,220 @@ def crawl(directory):
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
+
+    Kept for callers that want a dictionary; `crawl_graph` builds the
+    compact `LinkGraph` used by everything else directly.
     """
-    pages = dict()
+    return crawl_graph(directory).to_corpus()
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            # Don't add links to itself
-            pages[filename] = set(links) - {filename}
 
-    # Only include links to other pages in the corpus
-    for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
-        )
+def link_graph(corpus):
+    """
+    Return `corpus` as a `LinkGraph`, building one if it is a dictionary
+    returned by `crawl`.
+    """
+    if isinstance(corpus, LinkGraph):
+        return corpus
+    return LinkGraph.from_corpus(corpus)
 
-    return pages
+
+class LinkGraph():
+    """
+    Integer-indexed link graph of a corpus.
+
+    Page `i` is named `pages[i]`, and the pages it links to are
+    `links[offsets[i]:offsets[i + 1]]`, in compressed-sparse-row form.
+    """
+
+    def __init__(self, pages, offsets, links):
+        self.pages = pages
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.links = np.asarray(links, dtype=np.int64)
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Build a link graph from a `crawl` dictionary.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        offsets = [0]
+        links = []
+        for page in pages:
+            links.extend(sorted(index[link] for link in corpus[page]))
+            offsets.append(len(links))
+        return cls(pages, offsets, links)
+
+    @classmethod
+    def from_link_lists(cls, pages, link_lists):
+        """
+        Build a link graph from an iterable yielding, for each page
+        in turn, an array of the indices of the pages it links to.
+        """
+        offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+        links = [np.zeros(0, dtype=np.int64)]
+        for i, page_links in enumerate(link_lists):
+            links.append(page_links)
+            offsets[i + 1] = offsets[i] + len(page_links)
+        return cls(pages, offsets, np.concatenate(links))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def out_degrees(self):
+        """
+        Returns the number of links on each page.
+        """
+        return np.diff(self.offsets)
+
+    def sources(self):
+        """
+        Returns the page each link starts from, aligned with `links`.
+        """
+        return np.repeat(np.arange(len(self)), self.out_degrees())
+
+    def to_corpus(self):
+        """
+        Returns the graph as a `crawl` dictionary.
+        """
+        return {
+            page: set(self.pages[link] for link in
+                      self.links[self.offsets[i]:self.offsets[i + 1]])
+            for i, page in enumerate(self.pages)
+        }
+
+    def to_dict(self, values):
+        """
+        Returns a dictionary mapping each page name to its value.
+        """
+        return {page: float(value) for page, value in zip(self.pages, values)}
+
+
+class TransitionMatrix():
+    """
+    Sparse column-stochastic transition matrix of a link graph, stored as
+    (target, source, weight) triples, with dangling pages (no links)
+    treated as linking to every page.
+    """
+
+    def __init__(self, graph):
+        degrees = graph.out_degrees()
+        self.size = len(graph)
+        self.sources = graph.sources()
+        self.targets = graph.links
+        self.weights = 1 / degrees[self.sources]
+        self.dangling = np.flatnonzero(degrees == 0)
+
+    def transpose(self):
+        """
+        Returns the links grouped by target, as CSR offsets and sources.
+        """
+        order = np.argsort(self.targets, kind="stable")
+        offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.targets, minlength=self.size),
+                  out=offsets[1:])
+        return offsets, self.sources[order]
+
+    def dot(self, ranks):
+        """
+        Returns the product of the matrix and a rank vector.
+        """
+        product = np.bincount(self.targets,
+                              weights=ranks[self.sources] * self.weights,
+                              minlength=self.size)
+        return product + ranks[self.dangling].sum() / self.size
+
+    def dot_links(self, ranks):
+        """
+        Returns the product of the link part of the matrix (leaving out
+        dangling pages) and an N x K matrix of rank vectors.
+        """
+        product = np.zeros(ranks.shape)
+        np.add.at(product, self.targets,
+                  ranks[self.sources] * self.weights[:, np.newaxis])
+        return product
+
+
+def crawl_graph(directory, processes=None):
+    """
+    Parse a directory of HTML pages into a `LinkGraph` of the links
+    between them, ignoring links to pages outside the corpus and
+    links from a page to itself.
+
+    Files are streamed through an incremental HTML parser, so no page
+    is ever held in memory whole, and are parsed on a pool of
+    `processes` (by default, one per core; 1 parses in this process).
+    """
+    pages = sorted(
+        entry.name for entry in os.scandir(directory)
+        if entry.name.endswith(".html")
+    )
+    index = {page: i for i, page in enumerate(pages)}
+    paths = [os.path.join(directory, page) for page in pages]
+
+    if processes == 1:
+        init_crawler(index)
+        return LinkGraph.from_link_lists(pages, map(page_links, paths))
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=init_crawler,
+                             initargs=(index,)) as executor:
+        return LinkGraph.from_link_lists(
+            pages, executor.map(page_links, paths, chunksize=64))
+
+
+# Page name -> index of the corpus being crawled by a worker
+crawler_index = None
+
+
+def init_crawler(index):
+    """
+    Store the page index of the corpus in a crawler process.
+    """
+    global crawler_index
+    crawler_index = index
+
+
+def page_links(path):
+    """
+    Return the sorted indices of the corpus pages linked to by the page
+    at `path`, reading and parsing it `CHUNK_SIZE` bytes at a time.
+    """
+    page = crawler_index[os.path.basename(path)]
+    links = set(
+        crawler_index[link] for link in parse_links(path)
+        if link in crawler_index
+    )
+    links.discard(page)
+    return np.array(sorted(links), dtype=np.int64)
+
+
+def parse_links(path):
+    """
+    Return the set of every link on the page at `path`,
+    reading and parsing it `CHUNK_SIZE` bytes at a time.
+    """
+    parser = LinkParser()
+    with open(path) as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parser.feed(chunk)
+    parser.close()
+    return parser.links
+
+
+class LinkParser(HTMLParser):
+    """
+    Incremental HTML parser collecting the `href` of every `<a>` tag.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.links = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value is not None:
+                    self.links.add(value)
 
 
 def transition_model(corpus, page, damping_factor):
@@ -85,31 +380,152 @@ def sample_pagerank(corpus, damping_factor, n):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
+
+    `corpus` may also be a `LinkGraph`, as returned by `crawl_graph`.
     """
 
-    # Initialize the page ranks with 0
-    page_ranks = dict()
-    for corpus_page in corpus:
-        page_ranks[corpus_page] = 0
+    graph = link_graph(corpus)
+    counts = sample_counts(graph, damping_factor, n)
+    return graph.to_dict([count / n for count in counts])
+
+
+def sample_counts(graph, damping_factor, n, generator=random):
+    """
+    Return how many times each page of a `LinkGraph` is visited
+    in `n` steps of a random surfer starting on a random page.
+
+    Instead of building the transition model's distribution each step,
+    it is drawn as a mixture: with probability `damping_factor` follow
+    a random link (if the page has any), otherwise jump to a random page.
+    Both draws are uniform, so every step takes constant time.
+    """
+    offsets = graph.offsets.tolist()
+    links = graph.links.tolist()
+    size = len(graph)
+    counts = [0] * size
 
     # Start with a random page from the corpus
-    page = random.choice(list(corpus.keys()))
+    page = generator.randrange(size)
 
     # Create samples
     for i in range(n):
-        prob_dist = transition_model(corpus, page, damping_factor)
-        page = random.choices(list(prob_dist.keys()),
-                              list(prob_dist.values()))[0]
-        page_ranks[page] += 1
+        start = offsets[page]
+        degree = offsets[page + 1] - start
+        if degree > 0 and generator.random() < damping_factor:
+            page = links[start + generator.randrange(degree)]
+        else:
+            page = generator.randrange(size)
+        counts[page] += 1
+
+    return counts
+
 
-    # Normalize the page ranks
-    for rank_page in page_ranks:
-        page_ranks[rank_page] /= n
+def parallel_sample_pagerank(corpus, damping_factor, n, walkers,
+                             seed=None, processes=None):
+    """
+    Return PageRank values estimated by `walkers` independent random
+    surfers sharing `n` samples between them, run on a pool of `processes`
+    (by default, one per core).
+
+    Each walker has its own generator derived from `seed`, so a given
+    seed and number of walkers always gives the same result.
 
-    return page_ranks
+    Return a dictionary of page ranks, as `sample_pagerank` does, and a
+    dictionary mapping each page to a (low, high) `CONFIDENCE` interval
+    computed from the spread between walkers, using Student's t
+    distribution since there are only a few walkers.
 
+    `corpus` may also be a `LinkGraph`, as returned by `crawl_graph`.
+    """
+    if walkers < 2:
+        raise ValueError("at least two walkers are needed")
+    if n < walkers:
+        raise ValueError("every walker needs at least one sample")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    graph = link_graph(corpus)
+
+    # Share the samples out as evenly as possible
+    steps = [n // walkers + (walker < n % walkers)
+             for walker in range(walkers)]
+    tasks = [(walker, steps[walker], damping_factor, seed)
+             for walker in range(walkers)]
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=init_walker,
+                             initargs=(graph,)) as executor:
+        counts = np.array(list(executor.map(run_walker, tasks)))
+
+    # Merge the visit counts, and use each walker's own estimate
+    # as one observation of the rank
+    ranks = counts.sum(axis=0) / n
+    estimates = counts / np.array(steps)[:, np.newaxis]
+    error = (t_critical(walkers - 1) *
+             estimates.std(axis=0, ddof=1) / np.sqrt(walkers))
+    intervals = [(max(rank - margin, 0), min(rank + margin, 1))
+                 for rank, margin in zip(ranks, error)]
+    return graph.to_dict(ranks), dict(zip(graph.pages, intervals))
+
+
+def t_critical(df, confidence=CONFIDENCE):
+    """
+    Return the critical value of Student's t distribution with `df`
+    degrees of freedom: the value |t| stays below with probability
+    `confidence`.
 
-def iterate_pagerank(corpus, damping_factor):
+    Found by bisection on the closed form of P(|t| < x) for integer
+    degrees of freedom (Abramowitz and Stegun 26.7.3 and 26.7.4).
+    """
+    def central(x):
+        theta = math.atan(x / math.sqrt(df))
+        cos2 = math.cos(theta) ** 2
+        if df % 2:
+            term = total = math.cos(theta) if df > 1 else 0
+            for k in range(1, (df - 1) // 2):
+                term *= 2 * k / (2 * k + 1) * cos2
+                total += term
+            return 2 / math.pi * (theta + math.sin(theta) * total)
+        term = total = 1
+        for k in range(df // 2 - 1):
+            term *= (2 * k + 1) / (2 * k + 2) * cos2
+            total += term
+        return math.sin(theta) * total
+
+    low, high = 0, 1
+    while central(high) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if central(middle) < confidence:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+# Link graph shared by the walkers of a process pool
+walker_graph = None
+
+
+def init_walker(graph):
+    """
+    Store the link graph in a walker process.
+    """
+    global walker_graph
+    walker_graph = graph
+
+
+def run_walker(task):
+    """
+    Return the visit counts of one walker, given as
+    (walker number, steps, damping factor, seed).
+    """
+    walker, steps, damping_factor, seed = task
+    generator = random.Random(f"{seed}:{walker}")
+    return sample_counts(walker_graph, damping_factor, steps, generator)
+
+
+def iterate_pagerank(corpus, damping_factor, method="jacobi",
+                     tolerance=TOLERANCE):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -117,36 +533,425 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
+
+    `method` and `tolerance` are passed on to `iterate_ranks`.
+    `corpus` may also be a `LinkGraph`, as returned by `crawl_graph`.
+    """
+
+    graph = link_graph(corpus)
+    result = iterate_ranks(graph, damping_factor, method, tolerance)
+    return graph.to_dict(result.ranks)
+
+
+class IterationResult():
+    """
+    Ranks found by `iterate_ranks`, with the number of iterations
+    it took and the L1 residual after each iteration.
+    """
+
+    def __init__(self, ranks, iterations, residuals):
+        self.ranks = ranks
+        self.iterations = iterations
+        self.residuals = residuals
+
+
+def iterate_ranks(graph, damping_factor, method="jacobi",
+                  tolerance=TOLERANCE, initial=None,
+                  max_iterations=MAX_ITERATIONS):
+    """
+    Return an `IterationResult` with the PageRank vector of a `LinkGraph`,
+    iterating until the L1 norm of the residual (the change one more
+    power iteration step would make) is at most `tolerance`.
+
+    `method` is one of `METHODS`:
+        * "jacobi" is plain power iteration,
+        * "gauss-seidel" updates pages in place, using the ranks already
+          updated in the same sweep,
+        * "aitken" and "quadratic" are power iteration with Aitken's
+          delta-squared or quadratic extrapolation every
+          `EXTRAPOLATION_PERIOD` iterations.
+
+    Iteration starts from the `initial` ranks if given, which converges
+    much faster when they are close to the answer. Ranks are normalized
+    to sum to 1 after every iteration.
     """
+    if method not in METHODS:
+        raise ValueError(f"unknown method: {method}")
+    matrix = TransitionMatrix(graph)
+    teleport = (1 - damping_factor) / len(graph)
+
+    def step(ranks):
+        return teleport + damping_factor * matrix.dot(ranks)
 
     # Initialize the page ranks equally between all pages (1 / num. of pages)
-    page_ranks = dict()
-    for corpus_page in corpus:
-        page_ranks[corpus_page] = 1 / len(corpus)
-
-    # Calculate new rank values based on all of the current rank values until convergence
-    max_diff = float('inf')
-    while (max_diff > 0.001):
-        max_diff = 0
-        for page in page_ranks:
-            # Store the current rank value of the page
-            current_rank = page_ranks[page]
-
-            # Calculate the sum of the probabilities that we were on a page and chose the link to the page
-            sum = 0
-            for i in corpus:
-                if page in corpus[i]:
-                    sum += page_ranks[i] / len(corpus[i])
-
-            # Calculate the new rank value
-            page_ranks[page] = (1 - damping_factor) / len(corpus) + damping_factor * sum
-
-            # Compare the current rank value with the new rank value to determine the change
-            change = abs(current_rank - page_ranks[page])
-            if change > max_diff:
-                max_diff = change
-
-    return page_ranks
+    if initial is None:
+        ranks = np.full(len(graph), 1 / len(graph))
+    else:
+        ranks = np.asarray(initial, dtype=np.float64) / np.sum(initial)
+    if method == "gauss-seidel":
+        sweep = gauss_seidel(graph, matrix, damping_factor)
+
+    # The step taken to measure the residual of one iterate
+    # is the next iterate, except for Gauss-Seidel
+    history = [ranks]
+    residuals = []
+    stepped = None if method == "gauss-seidel" else step(ranks)
+    for iteration in range(1, max_iterations + 1):
+        if method == "gauss-seidel":
+            ranks = sweep(ranks)
+        else:
+            ranks = stepped
+
+        # Periodically jump towards the limit of the last few iterates
+        if method in ("aitken", "quadratic"):
+            history = history[-3:] + [ranks]
+            if iteration % EXTRAPOLATION_PERIOD == 0 and len(history) == 4:
+                if method == "aitken":
+                    ranks = aitken_extrapolation(*history[-3:])
+                else:
+                    ranks = quadratic_extrapolation(*history)
+                history = [ranks]
+
+        ranks = ranks / ranks.sum()
+        stepped = step(ranks)
+        residuals.append(float(np.abs(stepped - ranks).sum()))
+        if residuals[-1] <= tolerance:
+            break
+    return IterationResult(ranks, iteration, residuals)
+
+
+def personalized_pagerank(corpus, damping_factor, seed_sets, top_k=TOP_K,
+                          tolerance=TOLERANCE):
+    """
+    Return personalized PageRank values for each set of seed pages in
+    `seed_sets`, where the surfer only ever jumps to one of the seeds.
+    A seed set may also be a dictionary of seed pages to weights.
+
+    All seed sets are solved together by `personalized_ranks`. Return,
+    for each seed set, a dictionary of its `top_k` pages, highest first.
+    Raise ValueError if a seed set is empty, names a page that is not
+    in the corpus, or has weights that are negative or sum to 0.
+    `corpus` may also be a `LinkGraph`, as returned by `crawl_graph`.
+    """
+    if not seed_sets:
+        return []
+    graph = link_graph(corpus)
+    index = {page: i for i, page in enumerate(graph.pages)}
+    teleports = np.zeros((len(graph), len(seed_sets)))
+    for k, seeds in enumerate(seed_sets):
+        if not isinstance(seeds, dict):
+            seeds = {page: 1 for page in seeds}
+        for page, weight in seeds.items():
+            if page not in index:
+                raise ValueError(
+                    f"seed set {k + 1}: no page named {page!r} in the corpus")
+            if weight < 0:
+                raise ValueError(
+                    f"seed set {k + 1}: negative weight for {page!r}")
+            teleports[index[page], k] = weight
+        if teleports[:, k].sum() <= 0:
+            raise ValueError(f"seed set {k + 1} has no weight on any page")
+    result = personalized_ranks(graph, damping_factor, teleports, tolerance)
+
+    top = []
+    for k in range(len(seed_sets)):
+        column = result.ranks[:, k]
+        count = min(top_k, len(column))
+        best = np.argpartition(-column, count - 1)[:count]
+        best = best[np.argsort(-column[best], kind="stable")]
+        top.append({graph.pages[page]: float(column[page]) for page in best})
+    return top
+
+
+def personalized_ranks(graph, damping_factor, teleports,
+                       tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """
+    Return an `IterationResult` whose ranks are an N x K matrix, with the
+    PageRank vector for each of the K teleport distributions given as the
+    columns of the N x K matrix `teleports`.
+
+    All K vectors are iterated together, sharing each pass over the links.
+    Rank on dangling pages is redistributed along the teleport
+    distribution, so a uniform column gives the global PageRank. Residuals
+    are the largest L1 residual of any column.
+
+    Raise ValueError unless there is at least one column, and every column
+    is non-negative with a positive sum.
+    """
+    matrix = TransitionMatrix(graph)
+    teleports = np.asarray(teleports, dtype=np.float64)
+    if teleports.ndim != 2 or teleports.shape[1] == 0:
+        raise ValueError("no teleport distributions given")
+    if np.any(teleports < 0) or np.any(teleports.sum(axis=0) <= 0):
+        raise ValueError("teleport distributions must be non-negative "
+                         "and have a positive total weight")
+    teleports = teleports / teleports.sum(axis=0)
+
+    def step(ranks):
+        dangling = ranks[matrix.dangling].sum(axis=0)
+        return ((1 - damping_factor) * teleports + damping_factor * (
+            matrix.dot_links(ranks) + teleports * dangling))
+
+    ranks = teleports.copy()
+    residuals = []
+    for iteration in range(1, max_iterations + 1):
+        new_ranks = step(ranks)
+        residuals.append(float(np.abs(new_ranks - ranks).sum(axis=0).max()))
+        ranks = new_ranks / new_ranks.sum(axis=0)
+        if residuals[-1] <= tolerance:
+            break
+    return IterationResult(ranks, iteration, residuals)
+
+
+def gauss_seidel(graph, matrix, damping_factor):
+    """
+    Return a function performing one in-place Gauss-Seidel sweep
+    of the PageRank equations over a rank vector.
+    """
+    size = len(graph)
+    teleport = (1 - damping_factor) / size
+    offsets, sources = (values.tolist() for values in matrix.transpose())
+    degrees = graph.out_degrees().tolist()
+    inverse_degrees = [1 / degree if degree else 0 for degree in degrees]
+
+    def sweep(ranks):
+        ranks = ranks.tolist()
+        dangling = sum(
+            rank for rank, degree in zip(ranks, degrees) if degree == 0)
+        for page in range(size):
+            total = 0
+            for source in sources[offsets[page]:offsets[page + 1]]:
+                total += ranks[source] * inverse_degrees[source]
+            rank = teleport + damping_factor * (total + dangling / size)
+            if degrees[page] == 0:
+                dangling += rank - ranks[page]
+            ranks[page] = rank
+        return np.array(ranks)
+
+    return sweep
+
+
+def aitken_extrapolation(first, second, third):
+    """
+    Return the componentwise Aitken delta-squared extrapolation of three
+    successive iterates, keeping the last iterate where it is undefined.
+    """
+    curvature = third - 2 * second + first
+    defined = np.abs(curvature) > 1e-15
+    extrapolated = third.copy()
+    extrapolated[defined] = third[defined] - (
+        (third[defined] - second[defined]) ** 2 / curvature[defined])
+    return clip_ranks(extrapolated, third)
+
+
+def quadratic_extrapolation(first, second, third, fourth):
+    """
+    Return the quadratic extrapolation (Kamvar et al.) of four successive
+    iterates, which removes the next two eigenvector components.
+    """
+    y = np.column_stack([second - first, third - first])
+    gamma, *_ = np.linalg.lstsq(y, -(fourth - first), rcond=None)
+    gamma_1, gamma_2, gamma_3 = gamma[0], gamma[1], 1
+    extrapolated = ((gamma_1 + gamma_2 + gamma_3) * second +
+                    (gamma_2 + gamma_3) * third +
+                    gamma_3 * fourth)
+    return clip_ranks(extrapolated, fourth)
+
+
+def clip_ranks(extrapolated, fallback):
+    """
+    Return extrapolated ranks, falling back to the last iterate if the
+    extrapolation is unusable and clipping any negative ranks to 0.
+    """
+    if not np.all(np.isfinite(extrapolated)) or extrapolated.sum() <= 0:
+        return fallback
+    return np.maximum(extrapolated, 0)
+
+
+def incremental_pagerank(directory, damping_factor, method="jacobi",
+                         tolerance=TOLERANCE, state_file=None):
+    """
+    Return PageRank values for each page in `directory`, as
+    `iterate_pagerank` does, reusing the state saved by the previous run,
+    along with the `IterationResult` of solving with `method` and the
+    `LinkGraph` of the corpus.
+
+    Only pages whose size and modification time changed are re-read,
+    and of those only pages whose content hash changed are re-parsed.
+    Iteration starts from the previous ranks, with new pages starting
+    from the uniform rank. The new state is saved to `state_file`
+    (by default, `STATE_NAME` in `directory`).
+    """
+    if state_file is None:
+        state_file = os.path.join(directory, STATE_NAME)
+    previous = load_state(state_file)
+
+    # Reuse the links of unchanged pages, and parse the rest
+    pages = {}
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if not entry.name.endswith(".html"):
+            continue
+        stat = entry.stat()
+        page = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        old = previous["pages"].get(entry.name)
+        if old is not None and (old["size"], old["mtime"]) == (
+                page["size"], page["mtime"]):
+            page["hash"] = old["hash"]
+        else:
+            page["hash"] = file_hash(entry.path)
+        if old is not None and old["hash"] == page["hash"]:
+            page["links"] = old["links"]
+        else:
+            page["links"] = sorted(parse_links(entry.path))
+        pages[entry.name] = page
+
+    # Rebuild the link graph, since added or removed pages
+    # change which links point inside the corpus
+    names = list(pages)
+    index = {name: i for i, name in enumerate(names)}
+    graph = LinkGraph.from_link_lists(names, (
+        np.array(sorted(set(
+            index[link] for link in pages[name]["links"]
+            if link in index and link != name
+        )), dtype=np.int64)
+        for name in names
+    ))
+
+    initial = np.array([
+        previous["ranks"].get(name, 1 / len(names)) for name in names
+    ])
+    result = iterate_ranks(graph, damping_factor, method, tolerance,
+                           initial=initial)
+    ranks = graph.to_dict(result.ranks)
+    save_state(state_file, {
+        "version": STATE_VERSION,
+        "pages": pages,
+        "ranks": ranks
+    })
+    return ranks, result, graph
+
+
+def load_state(state_file):
+    """
+    Return the incremental ranking state saved in `state_file`,
+    or an empty state if there is none or it is from another version.
+    """
+    try:
+        with open(state_file, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") == STATE_VERSION:
+            return state
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    return {"version": STATE_VERSION, "pages": {}, "ranks": {}}
+
+
+def save_state(state_file, state):
+    """
+    Atomically replace `state_file` with `state`.
+    """
+    temporary = f"{state_file}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, state_file)
+
+
+def file_hash(path):
+    """
+    Return the SHA-256 digest of the file at `path`.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EdgeList():
+    """
+    Binary edge list file, memory-mapped so that edges are only
+    read from disk a block at a time.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(len(EDGE_LIST_MAGIC) + 16)
+        if header[:len(EDGE_LIST_MAGIC)] != EDGE_LIST_MAGIC:
+            raise ValueError(f"{path} is not an edge list")
+        self.size, count = np.frombuffer(
+            header[len(EDGE_LIST_MAGIC):], dtype="<i8")
+        self.size = int(self.size)
+        self.edges = np.memmap(path, dtype=EDGE_DTYPE, mode="r",
+                               offset=len(header), shape=(int(count),))
+
+    def __len__(self):
+        return len(self.edges)
+
+    def blocks(self, block_size=EDGE_BLOCK):
+        """
+        Yield (sources, targets) arrays of up to `block_size` edges.
+        """
+        for start in range(0, len(self.edges), block_size):
+            block = np.array(self.edges[start:start + block_size])
+            yield block["source"], block["target"]
+
+    def out_degrees(self, block_size=EDGE_BLOCK):
+        """
+        Returns the number of edges leaving each node.
+        """
+        degrees = np.zeros(self.size, dtype=np.int64)
+        for sources, _ in self.blocks(block_size):
+            degrees += np.bincount(sources, minlength=self.size)
+        return degrees
+
+
+def save_edge_list(path, graph):
+    """
+    Write the links of a `LinkGraph` to `path` as a binary edge list.
+    """
+    edges = np.empty(len(graph.links), dtype=EDGE_DTYPE)
+    edges["source"] = graph.sources()
+    edges["target"] = graph.links
+    with open(path, "wb") as f:
+        f.write(EDGE_LIST_MAGIC)
+        f.write(np.array([len(graph), len(edges)], dtype="<i8").tobytes())
+        f.write(edges.tobytes())
+
+
+def stream_ranks(path, damping_factor, tolerance=TOLERANCE,
+                 block_size=EDGE_BLOCK, max_iterations=MAX_ITERATIONS):
+    """
+    Return an `IterationResult` with the PageRank vector of the nodes of
+    the binary edge list at `path`, by power iteration that streams the
+    edges from disk `block_size` at a time. Only per-node vectors are
+    kept in memory, never the edges.
+
+    Stops once the L1 residual is at most `tolerance`, like `iterate_ranks`.
+    """
+    edge_list = EdgeList(path)
+    size = edge_list.size
+    degrees = edge_list.out_degrees(block_size)
+    dangling = degrees == 0
+    inverse_degrees = np.zeros(size)
+    inverse_degrees[~dangling] = 1 / degrees[~dangling]
+    teleport = (1 - damping_factor) / size
+
+    ranks = np.full(size, 1 / size)
+    residuals = []
+    for iteration in range(1, max_iterations + 1):
+        new_ranks = np.zeros(size)
+        for sources, targets in edge_list.blocks(block_size):
+            np.add.at(new_ranks, targets,
+                      ranks[sources] * inverse_degrees[sources])
+        new_ranks += ranks[dangling].sum() / size
+        new_ranks = teleport + damping_factor * new_ranks
+
+        # Each step's change is the residual of the previous ranks
+        residuals.append(float(np.abs(new_ranks - ranks).sum()))
+        ranks = new_ranks / new_ranks.sum()
+        if residuals[-1] <= tolerance:
+            break
+    return IterationResult(ranks, iteration, residuals)
 
 
 if __name__ == "__main__":